@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Fused face extraction: MTCNN boxes + landmarks -> aligned face batch
+Every face of a frame is rotated so its eyes are level, cropped with the
+detector's margin and resampled to 160x160 by one batched grid_sample
+per face-size level, replacing the per-face crop / cv2.resize /
+torch.tensor round trip. The ONNX runtime uses the same sampling in numpy.
+"""
+import math
+import cv2
+import numpy as np
+
+IMAGE_SIZE = 160
+# Large faces are area-downscaled first (per face, by a power of two) so the
+# final bilinear resample never skips more than this many source pixels per
+# output pixel (anti-aliasing, like the INTER_AREA resize MTCNN.extract uses)
+MAX_SAMPLE_STEP = 2
+# Bumped whenever the crops change, so cached embeddings are made again
+ALIGNMENT_REVISION = 2
+
+
+def prewhiten(batch):
+    """[0, 1] RGB batch -> fixed standardization the vggface2 weights expect"""
+    return (batch * 255.0 - 127.5) / 128.0
+
+
+def face_geometry(boxes, landmarks, margin, image_size=IMAGE_SIZE):
+    """
+    Per face: centre (F, 2), margin-expanded size (F, 2) and eye-line angle
+    (F,) in radians. The margin is in output pixels, as in MTCNN.extract.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    sizes = boxes[:, 2:] - boxes[:, :2]
+    sizes = sizes + margin * sizes / (image_size - margin)
+    centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+    if landmarks is None:
+        angles = np.zeros(len(boxes))
+    else:
+        # MTCNN points: left eye, right eye, nose, mouth left, mouth right
+        eyes = np.asarray(landmarks, dtype=np.float64).reshape(-1, 5, 2)[:, :2]
+        delta = eyes[:, 1] - eyes[:, 0]
+        angles = np.arctan2(delta[:, 1], delta[:, 0])
+    return centers, sizes, angles
+
+
+def align_faces(rgb, boxes, landmarks=None, margin=0, image_size=IMAGE_SIZE, device="cpu"):
+    """
+    Aligned faces (F, 3, image_size, image_size), float in [0, 1], for every
+    box of an RGB frame. `landmarks` are MTCNN's (F, 5, 2) points; without
+    them the crops are axis-aligned. With device=None the faces are a
+    float32 numpy array sampled without torch (ONNX runtime).
+    """
+    centers, sizes, angles = face_geometry(boxes, landmarks, margin, image_size)
+    # Power-of-two pre-scale per face so every face is sampled with a step
+    # of at most MAX_SAMPLE_STEP; faces of similar size share one resample
+    steps = sizes.max(axis=1) / image_size
+    levels = np.maximum(0, np.ceil(np.log2(steps / MAX_SAMPLE_STEP))).astype(int)
+    groups = [(np.flatnonzero(levels == level), 0.5 ** level) for level in np.unique(levels)]
+    shape = (len(centers), 3, image_size, image_size)
+
+    if device is None:
+        faces = np.empty(shape, dtype=np.float32)
+        for group, scale in groups:
+            region, theta = _sample_region(rgb, centers[group], sizes[group], angles[group], scale)
+            faces[group] = _grid_sample(region, theta, image_size)
+        return faces
+
+    import torch
+    with torch.inference_mode():
+        faces = torch.empty(shape, device=device)
+        for group, scale in groups:
+            region, theta = _sample_region(rgb, centers[group], sizes[group], angles[group], scale)
+            faces[torch.from_numpy(group).to(device)] = _torch_grid_sample(region, theta, image_size, device)
+        return faces
+
+
+def concat_faces(batches):
+    """Concatenate align_faces batches (numpy arrays or tensors)"""
+    if isinstance(batches[0], np.ndarray):
+        return np.concatenate(batches)
+    import torch
+    return torch.cat(batches)
+
+
+def _sample_region(rgb, centers, sizes, angles, scale):
+    """
+    Faces of one pre-scale level: the frame region covering them,
+    area-resized by `scale`, and the (F, 2, 3) affine_grid thetas
+    """
+    cos, sin = np.cos(angles), np.sin(angles)
+
+    # One region covering every rotated crop; only it is converted to float
+    half_x = (np.abs(cos) * sizes[:, 0] + np.abs(sin) * sizes[:, 1]) / 2
+    half_y = (np.abs(sin) * sizes[:, 0] + np.abs(cos) * sizes[:, 1]) / 2
+    height, width = rgb.shape[:2]
+    x0 = min(max(0, math.floor((centers[:, 0] - half_x).min())), width - 1)
+    y0 = min(max(0, math.floor((centers[:, 1] - half_y).min())), height - 1)
+    x1 = max(min(width, math.ceil((centers[:, 0] + half_x).max())), x0 + 1)
+    y1 = max(min(height, math.ceil((centers[:, 1] + half_y).max())), y0 + 1)
+    region = rgb[y0:y1, x0:x1]
+
+    if scale < 1.0:
+        region = cv2.resize(region, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    region_h, region_w = region.shape[:2]
+    sx, sy = region_w / (x1 - x0), region_h / (y1 - y0)
+
+    # Output grid [-1, 1]^2 -> rotated, margin-expanded box in normalized
+    # region coordinates (x_n = 2x / W - 1, align_corners=False)
+    theta = np.empty((len(centers), 2, 3))
+    theta[:, 0, 0] = sx * cos * sizes[:, 0] / region_w
+    theta[:, 0, 1] = -sx * sin * sizes[:, 1] / region_w
+    theta[:, 0, 2] = 2 * sx * (centers[:, 0] - x0) / region_w - 1
+    theta[:, 1, 0] = sy * sin * sizes[:, 0] / region_h
+    theta[:, 1, 1] = sy * cos * sizes[:, 1] / region_h
+    theta[:, 1, 2] = 2 * sy * (centers[:, 1] - y0) / region_h - 1
+    return region, theta.astype(np.float32)
+
+
+def _torch_grid_sample(region, theta, image_size, device):
+    import torch
+    import torch.nn.functional as F
+    count = len(theta)
+    frame = torch.from_numpy(np.ascontiguousarray(region)).to(device)
+    frame = frame.permute(2,0,1).unsqueeze(0).float()/255.0
+    grid = F.affine_grid(torch.from_numpy(theta).to(device),
+                         (count, 3, image_size, image_size), align_corners=False)
+    # Sample all faces from the single frame: stack the grids vertically
+    # so the frame is never copied per face
+    grid = grid.reshape(1, count * image_size, image_size, 2)
+    faces = F.grid_sample(frame, grid, mode="bilinear", padding_mode="zeros", align_corners=False)
+    return faces.reshape(3, count, image_size, image_size).permute(1,0,2,3)
+
+
+def _grid_sample(region, theta, image_size):
+    """numpy affine_grid + grid_sample (bilinear, zero padding, align_corners=False)"""
+    frame = region.astype(np.float32) / np.float32(255.0)
+    height, width = frame.shape[:2]
+    base = (2 * np.arange(image_size, dtype=np.float32) + 1) / np.float32(image_size) - 1
+    t = theta[:, :, :, None, None]
+    gx = t[:, 0, 0] * base + t[:, 0, 1] * base[:, None] + t[:, 0, 2]
+    gy = t[:, 1, 0] * base + t[:, 1, 1] * base[:, None] + t[:, 1, 2]
+    ix = ((gx + 1) * width - 1) / 2
+    iy = ((gy + 1) * height - 1) / 2
+    x0, y0 = np.floor(ix), np.floor(iy)
+    wx, wy = ix - x0, iy - y0
+    x0, y0 = x0.astype(np.int64), y0.astype(np.int64)
+
+    faces = np.zeros(ix.shape + (3,), dtype=np.float32)
+    for dy, weight_y in ((0, 1 - wy), (1, wy)):
+        for dx, weight_x in ((0, 1 - wx), (1, wx)):
+            x, y = x0 + dx, y0 + dy
+            inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            weight = weight_y * weight_x * inside
+            faces += weight[..., None] * frame[y.clip(0, height - 1), x.clip(0, width - 1)]
+    return faces.transpose(0, 3, 1, 2)
@@ -0,0 +1,367 @@
+#!/usr/bin/env python3
+"""
+Nearest-neighbour index backends for the face gallery
+- ExactIndex: brute-force scan, one GEMM over every stored embedding
+- IVFIndex:   inverted-file index (spherical k-means lists); only `nprobe`
+              of `nlist` lists are scanned per query, trading recall for latency
+- QuantizedIndex: brute-force scan over a float16 or int8 copy of large
+              galleries, then exact float32 re-ranking of the best candidates
+
+Indexes are immutable once built: FaceGallery derives a new index for every
+gallery state (extended() on enrollment, a rebuild on removal), so lookups
+never see an index that is being modified. Each backend also decides where
+the gallery keeps its float32 rows (allocate/release): in memory for the
+backends that scan them, in a file-backed mapping for a QuantizedIndex
+once it quantizes (release is called on the index built for the rows).
+"""
+import mmap
+import os
+import tempfile
+import numpy as np
+
+# Similarity returned for padded result slots when fewer than k rows exist
+NO_SIMILARITY = -np.inf
+
+
+def _top_k(similarities, k):
+    """Row-wise top-k (indices, values) sorted best first"""
+    k = min(k, similarities.shape[1])
+    top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+    top_sims = np.take_along_axis(similarities, top, axis=1)
+    order = np.argsort(-top_sims, axis=1)
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_sims, order, axis=1)
+
+
+def _pad(indices, similarities, k):
+    missing = k - indices.shape[1]
+    if missing <= 0:
+        return indices, similarities
+    rows = indices.shape[0]
+    return (np.hstack([indices, np.full((rows, missing), -1, dtype=np.int64)]),
+            np.hstack([similarities, np.full((rows, missing), NO_SIMILARITY, dtype=np.float32)]))
+
+
+class ResidentRows:
+    """Float32 gallery rows in process memory (every search reads all of them)"""
+
+    def allocate(self, capacity, dim):
+        return np.empty((capacity, dim), dtype=np.float32)
+
+    def release(self, matrix):
+        """Called after the gallery wrote or scanned `matrix`"""
+
+
+class ExactIndex(ResidentRows):
+    """Brute-force inner-product search over the whole gallery"""
+
+    name = "exact"
+
+    def build(self, encodings):
+        return self
+
+    def extended(self, encodings, start, stop):
+        return self
+
+    def search(self, encodings, queries, k):
+        """Return (indices, similarities), both (F, k), best first"""
+        if not len(encodings):
+            return _pad(np.zeros((len(queries), 0), np.int64), np.zeros((len(queries), 0), np.float32), k)
+        indices, similarities = _top_k(queries @ encodings.T, k)
+        return _pad(indices.astype(np.int64), similarities, k)
+
+
+class IVFIndex(ResidentRows):
+    """
+    Inverted-file index over unit-norm embeddings. Lists are trained with
+    spherical k-means once the gallery has at least `min_train` rows; below
+    that every search is an exact scan. New rows are assigned to the
+    nearest existing list, and the lists are retrained when the gallery
+    outgrows the training set by `retrain_factor`.
+    """
+
+    name = "ivf"
+
+    def __init__(self, nlist=None, nprobe=8, min_train=2048, retrain_factor=4,
+                 train_iters=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train = min_train
+        self.retrain_factor = retrain_factor
+        self.train_iters = train_iters
+        self.seed = seed
+        self.centroids = None
+        self.list_ids = []
+        self.list_vectors = []
+        self.trained_on = 0
+
+    def _clone(self):
+        clone = IVFIndex(self.nlist, self.nprobe, self.min_train, self.retrain_factor,
+                         self.train_iters, self.seed)
+        clone.centroids = self.centroids
+        clone.list_ids = list(self.list_ids)
+        clone.list_vectors = list(self.list_vectors)
+        clone.trained_on = self.trained_on
+        return clone
+
+    @property
+    def trained(self):
+        return self.centroids is not None
+
+    def _assign(self, vectors, chunk=8192):
+        assignment = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk):
+            block = vectors[start:start + chunk]
+            assignment[start:start + chunk] = np.argmax(block @ self.centroids.T, axis=1)
+        return assignment
+
+    def _train(self, encodings):
+        rng = np.random.default_rng(self.seed)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(encodings))))
+        nlist = min(nlist, len(encodings))
+        sample_size = min(len(encodings), nlist * 64)
+        sample = encodings[rng.choice(len(encodings), sample_size, replace=False)]
+
+        self.centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+        for _ in range(self.train_iters):
+            assignment = self._assign(sample)
+            order = np.argsort(assignment, kind="stable")
+            lists, starts = np.unique(assignment[order], return_index=True)
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()  # reseed empty lists
+            centroids[lists] = sums / np.maximum(norms, 1e-12)
+            self.centroids = centroids.astype(np.float32)
+        self.trained_on = len(encodings)
+
+    def _fill(self, encodings, ids):
+        """Distribute gallery rows `ids` into the lists (copy-on-write)"""
+        assignment = self._assign(encodings[ids])
+        order = np.argsort(assignment, kind="stable")
+        lists, starts = np.unique(assignment[order], return_index=True)
+        for list_no, group in zip(lists, np.split(ids[order], starts[1:])):
+            self.list_ids[list_no] = np.concatenate([self.list_ids[list_no], group])
+            # Contiguous per-list copy keeps the probe scan cache friendly
+            self.list_vectors[list_no] = np.concatenate([self.list_vectors[list_no], encodings[group]])
+
+    def build(self, encodings):
+        index = self._clone()
+        index.centroids = None
+        index.list_ids, index.list_vectors = [], []
+        index.trained_on = 0
+        if len(encodings) < self.min_train:
+            return index
+
+        index._train(encodings)
+        dim = encodings.shape[1]
+        index.list_ids = [np.zeros(0, np.int64) for _ in range(len(index.centroids))]
+        index.list_vectors = [np.zeros((0, dim), np.float32) for _ in range(len(index.centroids))]
+        index._fill(encodings, np.arange(len(encodings), dtype=np.int64))
+        return index
+
+    def extended(self, encodings, start, stop):
+        """Index for the gallery after rows [start, stop) were appended"""
+        if not self.trained or stop > self.retrain_factor * self.trained_on:
+            if stop >= self.min_train:
+                return self.build(encodings[:stop])
+            return self
+        index = self._clone()
+        index._fill(encodings, np.arange(start, stop, dtype=np.int64))
+        return index
+
+    def search(self, encodings, queries, k):
+        if not self.trained:
+            return ExactIndex().search(encodings, queries, k)
+
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes, _ = _top_k(queries @ self.centroids.T, nprobe)
+        indices = np.full((len(queries), k), -1, dtype=np.int64)
+        similarities = np.full((len(queries), k), NO_SIMILARITY, dtype=np.float32)
+        for row, (query, lists) in enumerate(zip(queries, probes)):
+            ids = np.concatenate([self.list_ids[l] for l in lists])
+            if not len(ids):
+                continue
+            sims = np.concatenate([self.list_vectors[l] @ query for l in lists])
+            top, top_sims = _top_k(sims[np.newaxis], k)
+            indices[row, :top.shape[1]] = ids[top[0]]
+            similarities[row, :top.shape[1]] = top_sims[0]
+        return indices, similarities
+
+
+def _mapping(array):
+    """The mmap an array view was created from, or None"""
+    while array is not None and not isinstance(array, mmap.mmap):
+        array = array.obj if isinstance(array, memoryview) else getattr(array, "base", None)
+    return array
+
+
+def evict(array):
+    """
+    Drop the pages of a memory-mapped array from this process (they stay in
+    the file / page cache and are read back on access). No-op for arrays
+    in memory and where madvise is unavailable (Windows).
+    """
+    mapping = _mapping(array)
+    if mapping is not None and hasattr(mapping, "madvise"):
+        mapping.madvise(mmap.MADV_DONTNEED)
+
+
+# Gallery size from which the quantized scan beats ExactIndex's float32
+# GEMM (benchmark_index.py on one core: int8 wins from about 10k rows,
+# float16 from about 50k); smaller galleries are scanned exactly
+MIN_QUANTIZED_ROWS = {"int8": 10000, "float16": 50000}
+
+
+def _int8_matmul():
+    """
+    int8 x int8 -> int32 GEMM: torch._int_mm when this build has a CPU
+    kernel for it, else a float32 GEMM (exact for int8 x int8 x 512 sums)
+    """
+    import torch
+
+    def float_matmul(a, b):
+        return (a.float() @ b.float()).int()
+
+    probe = torch.ones(32, 64, dtype=torch.int8)
+    try:
+        # Older builds define _int_mm without a CPU kernel (RuntimeError)
+        torch._int_mm(probe, probe.T.contiguous())
+    except (AttributeError, RuntimeError):
+        return float_matmul
+
+    def int_matmul(a, b):
+        try:
+            return torch._int_mm(a, b)
+        except RuntimeError:
+            # Shapes the kernel does not support
+            return float_matmul(a, b)
+    return int_matmul
+
+
+class QuantizedIndex:
+    """
+    Scan over a compact copy of the gallery: float16 (2x smaller than
+    float32) or int8 with one float32 scale per row (~4x smaller). The
+    `rerank` best candidates of that scan are then re-scored exactly
+    against the float32 rows, so results only differ from ExactIndex if
+    the true best row is not among the candidates.
+    Below `min_rows` (default MIN_QUANTIZED_ROWS) the gallery is scanned
+    exactly in memory, as with ExactIndex. From there on only the compact
+    copy stays in memory: the gallery keeps its float32 rows in an
+    unlinked file under `storage_dir` (allocate) and their pages are
+    dropped after every write (release), so a search only reads the
+    candidates' rows back. int8 scores with an int8 x int8 -> int32 GEMM
+    on a quantized query. The scans run on torch, imported on first use.
+    """
+
+    name = "quantized"
+
+    def __init__(self, precision="int8", rerank=16, storage_dir=None, min_rows=None):
+        if precision not in ("float16", "int8"):
+            raise ValueError(f"Unknown precision: {precision}")
+        self.precision = precision
+        self.rerank = rerank
+        self.storage_dir = storage_dir  # None = the system temp directory
+        self.min_rows = MIN_QUANTIZED_ROWS[precision] if min_rows is None else min_rows
+        self.codes = None  # None while the gallery is below min_rows
+        self.scales = None  # int8 only
+        self._matmul = None
+
+    def _clone(self):
+        clone = QuantizedIndex(self.precision, self.rerank, self.storage_dir, self.min_rows)
+        clone.codes, clone.scales, clone._matmul = self.codes, self.scales, self._matmul
+        return clone
+
+    @property
+    def quantized(self):
+        return self.codes is not None
+
+    def allocate(self, capacity, dim):
+        """(capacity, dim) float32 rows, backed by an unlinked temporary file from min_rows on"""
+        if capacity < self.min_rows:
+            return ResidentRows().allocate(capacity, dim)
+        if self.storage_dir:
+            os.makedirs(self.storage_dir, exist_ok=True)
+        with tempfile.TemporaryFile(dir=self.storage_dir) as f:
+            f.truncate(max(capacity, 1) * dim * 4)
+            # The mapping keeps the file alive after it is closed
+            buffer = mmap.mmap(f.fileno(), 0)
+        return np.frombuffer(buffer, dtype=np.float32, count=capacity * dim).reshape(capacity, dim)
+
+    def release(self, matrix):
+        # Below min_rows every search still reads all rows
+        if self.quantized:
+            evict(matrix)
+
+    @staticmethod
+    def _quantize_int8(vectors):
+        """Symmetric per-row int8 codes and float32 scales"""
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.round(vectors / scales[:, np.newaxis]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def _quantize(self, vectors):
+        if self.precision == "float16":
+            return vectors.astype(np.float16), None
+        return self._quantize_int8(vectors)
+
+    def build(self, encodings):
+        index = self._clone()
+        index.codes = index.scales = None
+        if len(encodings) >= self.min_rows:
+            index.codes, index.scales = self._quantize(encodings)
+            if self.precision == "int8" and index._matmul is None:
+                # Chosen once, then shared by every index derived from this one
+                index._matmul = _int8_matmul()
+        return index
+
+    def extended(self, encodings, start, stop):
+        if not self.quantized:
+            return self.build(encodings[:stop]) if stop >= self.min_rows else self
+        codes, scales = self._quantize(encodings[start:stop])
+        index = self._clone()
+        index.codes = np.concatenate([self.codes, codes])
+        if scales is not None:
+            index.scales = np.concatenate([self.scales, scales])
+        return index
+
+    @property
+    def nbytes(self):
+        if not self.quantized:
+            return 0
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def _scan(self, queries):
+        """Approximate (F, N) similarities over the compact rows"""
+        import torch
+        codes = torch.from_numpy(self.codes)
+        if self.precision == "float16":
+            # numpy has no fast half-precision kernels; torch scans the rows in place
+            return (torch.from_numpy(queries).to(torch.float16) @ codes.T).float().numpy()
+        # int8: quantize the queries too and accumulate in int32
+        query_codes, query_scales = self._quantize_int8(queries)
+        products = self._matmul(codes, torch.from_numpy(query_codes).T.contiguous()).numpy()
+        return products.T * query_scales[:, np.newaxis] * self.scales
+
+    def search(self, encodings, queries, k):
+        if not self.quantized:
+            return ExactIndex().search(encodings, queries, k)
+        candidates, _ = _top_k(self._scan(queries), max(k, self.rerank))
+        # Exact float32 similarities of the candidates only, computed the
+        # same way as ExactIndex (query @ rows.T), so scores agree with it
+        # within float32 rounding
+        exact = np.concatenate([query[np.newaxis] @ encodings[rows].T
+                                for query, rows in zip(queries, candidates)])
+        top, top_sims = _top_k(exact, k)
+        return _pad(np.take_along_axis(candidates, top, axis=1).astype(np.int64), top_sims, k)
+
+
+def make_index(backend="exact", **params):
+    """Create an index backend by name ("exact", "ivf" or "quantized")"""
+    if backend == "exact":
+        return ExactIndex()
+    if backend == "ivf":
+        return IVFIndex(**params)
+    if backend == "quantized":
+        return QuantizedIndex(**params)
+    raise ValueError(f"Unknown index backend: {backend}")
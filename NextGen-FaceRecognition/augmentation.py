@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Batched face augmentation for enrollment and test-time augmentation (TTA)
+Every face crop is expanded into all requested augmentations on one stacked
+tensor, which is embedded with a single inference-mode forward pass.
+Numpy face batches (ONNX runtime) take the same path without torch.
+"""
+import numpy as np
+from alignment import prewhiten, concat_faces
+
+# name -> transform on a (N, 3, 160, 160) float tensor or array in [0, 1]
+AUGMENTATIONS = {
+    "original": lambda x: x,
+    "flip": lambda x: x[..., ::-1].copy() if isinstance(x, np.ndarray) else x.flip(3),  # horizontal flip
+    "darker": lambda x: (x * 0.9).clip(0, 1),
+    "brighter": lambda x: (x * 1.1).clip(0, 1),
+}
+
+ENROLL_AUGMENTATIONS = ("original", "flip", "darker", "brighter")
+
+
+def augment_tensor(face_tensors, augmentations):
+    """
+    Stack every augmentation of every face: (N*A, 3, 160, 160), grouped
+    per augmentation (rows [a*N:(a+1)*N] hold augmentation a)
+    """
+    unknown = [name for name in augmentations if name not in AUGMENTATIONS]
+    if unknown:
+        raise ValueError(f"Unknown augmentations: {unknown}")
+    return concat_faces([AUGMENTATIONS[name](face_tensors) for name in augmentations])
+
+
+def embed_faces(resnet, device, faces, augmentations=("original",), average=False):
+    """
+    Embed an aligned (N, 3, 160, 160) face batch (see alignment.py) with the
+    given augmentations in one forward pass. With device=None the faces
+    are numpy and `resnet` is an ONNX session.
+    Returns unit-norm embeddings: (N*A, 512) in face-major order, or (N, 512)
+    with the augmentations averaged per face when `average` (TTA).
+    """
+    count = len(faces)
+    if device is None:
+        embeddings = resnet(prewhiten(augment_tensor(faces, augmentations)))
+    else:
+        import torch
+        with torch.inference_mode():
+            batch = augment_tensor(faces.to(device), augmentations)
+            embeddings = resnet(prewhiten(batch)).cpu().numpy()
+
+    embeddings = embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
+    # (A, N, 512) -> (N, A, 512) so each face's augmentations are adjacent
+    embeddings = embeddings.reshape(len(augmentations), count, -1).transpose(1, 0, 2)
+    if not average:
+        return embeddings.reshape(count * len(augmentations), -1)
+    embeddings = embeddings.mean(axis=1)
+    return embeddings / np.linalg.norm(embeddings, axis=1, keepdims=True)
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Benchmark recognition throughput with many concurrent clients
+Each client thread calls FaceEngine.recognize() back to back on dataset
+frames, like kiosks posting to a threaded /api/recognize-dignitary.
+Compares every request embedding on its own with micro-batched embedding
+(EngineConfig.embed_batch_size) and reports requests/s and latency.
+
+    python benchmark_concurrency.py                     # 1, 4, 10 and 16 clients
+    python benchmark_concurrency.py --clients 10 --batch-sizes 0 16 64
+"""
+import argparse
+import os
+import threading
+import time
+import cv2
+import numpy as np
+import torch
+from face_engine import EngineConfig, FaceEngine
+
+
+def load_frames(dataset, width, limit):
+    frames = []
+    for person in sorted(os.listdir(dataset)):
+        folder = os.path.join(dataset, person)
+        if not os.path.isdir(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            img = cv2.imread(os.path.join(folder, filename))
+            if img is not None:
+                height = round(img.shape[0] * width / img.shape[1])
+                frames.append(cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)[:, :, ::-1].copy())
+    return frames[:limit]
+
+
+def run_clients(engine, frames, clients, seconds):
+    """(requests/s, latencies in ms) of `clients` threads recognizing for `seconds`"""
+    latencies = [[] for _ in range(clients)]
+    stop = threading.Event()
+
+    def client(index):
+        i = index
+        while not stop.is_set():
+            started = time.perf_counter()
+            engine.recognize(frames[i % len(frames)], max_faces=1)
+            latencies[index].append((time.perf_counter() - started) * 1000)
+            i += clients
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    flat = np.concatenate([np.array(l) for l in latencies if l])
+    return len(flat) / elapsed, flat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dataset", default="dataset")
+    parser.add_argument("--width", type=int, default=640, help="client frame width")
+    parser.add_argument("--frames", type=int, default=20)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 4, 10, 16])
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[0, 32])
+    parser.add_argument("--wait-ms", type=float, default=3.0)
+    parser.add_argument("--detection-scale", type=float, default=1.0)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    args = parser.parse_args()
+
+    frames = load_frames(args.dataset, args.width, args.frames)
+    print(f"{len(frames)} frames {args.width}px wide, {torch.get_num_threads()} torch threads")
+    print(f"{'clients':>7} {'batch':>6} {'req/s':>7} {'p50 ms':>7} {'p95 ms':>7}  batching")
+    for batch_size in args.batch_sizes:
+        engine = FaceEngine(EngineConfig(dataset_path=args.dataset, embed_batch_size=batch_size,
+                                         embed_batch_wait_ms=args.wait_ms,
+                                         detection_scale=args.detection_scale))
+        engine.load_dataset()
+        engine.recognize(frames[0])  # warm-up
+        for clients in args.clients:
+            if engine.batcher is not None:
+                engine.batcher.stats.clear()
+            rate, latencies = run_clients(engine, frames, clients, args.seconds)
+            batching = engine.batcher.summary() if engine.batcher is not None else "off"
+            print(f"{clients:>7} {batch_size:>6} {rate:>7.1f} {np.percentile(latencies, 50):>7.0f} "
+                  f"{np.percentile(latencies, 95):>7.0f}  {batching}")
+        if engine.batcher is not None:
+            engine.batcher.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark MTCNN latency and recall at different detection scales
+Frames are built from the dataset images resized to a webcam width; with
+--shrink the photo is pasted smaller into a grey canvas, which gives
+faces the size people have standing further from the kiosk. Recall is
+measured against detection on the full-resolution frame (IoU >= 0.5).
+The smallest face MTCNN can still find is min_face_size / scale.
+
+    python benchmark_detection.py                       # 1280px frames
+    python benchmark_detection.py --scales 1 0.5 --shrink 1 0.5 0.3
+"""
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+from face_engine import EngineConfig, detect_faces, make_detector
+from face_tracker import box_iou
+
+
+def build_frames(dataset, width, shrink):
+    """(name, RGB frame) per dataset image and shrink factor"""
+    frames = []
+    for person in sorted(os.listdir(dataset)):
+        folder = os.path.join(dataset, person)
+        if not os.path.isdir(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            img = cv2.imread(os.path.join(folder, filename))
+            if img is None:
+                continue
+            height = round(img.shape[0] * width / img.shape[1])
+            img = cv2.resize(img, (width, height), interpolation=cv2.INTER_AREA)
+            for factor in shrink:
+                frame = np.full_like(img, 128)
+                small = cv2.resize(img, None, fx=factor, fy=factor, interpolation=cv2.INTER_AREA)
+                y, x = (height - small.shape[0]) // 2, (width - small.shape[1]) // 2
+                frame[y:y + small.shape[0], x:x + small.shape[1]] = small
+                frames.append((f"{filename}@{factor}", frame[:, :, ::-1].copy()))
+    return frames
+
+
+def recall(reference, boxes):
+    """Fraction of reference boxes found again with IoU >= 0.5"""
+    if reference is None or not len(reference):
+        return None
+    if boxes is None or not len(boxes):
+        return 0.0
+    return float(np.mean(box_iou(reference, boxes).max(axis=1) >= 0.5))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dataset", default="dataset")
+    parser.add_argument("--width", type=int, default=1280, help="camera frame width")
+    parser.add_argument("--scales", type=float, nargs="+", default=[1.0, 0.75, 0.5, 0.35, 0.25])
+    parser.add_argument("--shrink", type=float, nargs="+", default=[1.0, 0.5, 0.25],
+                        help="photo size within the frame (smaller = faces further away)")
+    parser.add_argument("--repeats", type=int, default=1)
+    args = parser.parse_args()
+
+    config = EngineConfig(dataset_path=args.dataset)
+    mtcnn = make_detector(config, "cpu")
+    frames = build_frames(args.dataset, args.width, args.shrink)
+    if not frames:
+        print(f"❌ No images found in {args.dataset}")
+        return
+    references = [detect_faces(mtcnn, rgb)[0] for _, rgb in frames]
+    found = sum(len(r) for r in references if r is not None)
+    print(f"{len(frames)} frames {args.width}px wide, {found} faces at full resolution, "
+          f"min_face_size={config.min_face_size}")
+
+    print(f"{'scale':>6} {'ms/frame':>9} {'speedup':>8} {'recall':>7} {'min face px':>12}")
+    baseline = None
+    for scale in args.scales:
+        start = time.perf_counter()
+        for _ in range(args.repeats):
+            results = [detect_faces(mtcnn, rgb, scale)[0] for _, rgb in frames]
+        ms = (time.perf_counter() - start) * 1000 / (len(frames) * args.repeats)
+        baseline = baseline or ms
+        recalls = [r for r in map(recall, references, results) if r is not None]
+        mean_recall = float(np.mean(recalls)) if recalls else float("nan")
+        print(f"{scale:>6.2f} {ms:>9.1f} {baseline / ms:>7.1f}x {mean_recall:>7.3f} "
+              f"{config.min_face_size / scale:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
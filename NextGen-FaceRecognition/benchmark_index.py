@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark exact vs IVF vs quantized nearest-neighbour search for large galleries
+Uses synthetic unit-norm identities (no models or dataset needed) and
+reports build time, per-lookup latency, recall@1 against exact search and
+the size of the data each backend scans.
+
+    python benchmark_index.py                 # 1k, 10k and 100k identities
+    python benchmark_index.py --sizes 1000 --nprobe 4 8 16
+"""
+import argparse
+import time
+import numpy as np
+from ann_index import ExactIndex, IVFIndex, QuantizedIndex
+
+EMBEDDING_DIM = 512
+
+
+def synthetic_gallery(identities, images_per_person, rng):
+    """Identity centres plus per-image noise, roughly FaceNet-like spreads"""
+    centres = rng.standard_normal((identities, EMBEDDING_DIM)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    rows = np.repeat(centres, images_per_person, axis=0)
+    rows += 0.03 * rng.standard_normal(rows.shape).astype(np.float32)
+    rows /= np.linalg.norm(rows, axis=1, keepdims=True)
+    return centres, rows
+
+
+def noisy_queries(centres, count, rng):
+    picks = rng.choice(len(centres), count)
+    queries = centres[picks] + 0.03 * rng.standard_normal((count, EMBEDDING_DIM)).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+
+def time_lookups(index, encodings, queries):
+    """Mean single-query latency in ms (the kiosk path matches one frame at a time)"""
+    index.search(encodings, queries[:1], 1)  # warm-up (lazy imports, kernel choice)
+    start = time.perf_counter()
+    results = [index.search(encodings, q[np.newaxis], 1)[0][0, 0] for q in queries]
+    return (time.perf_counter() - start) * 1000 / len(queries), np.array(results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--images-per-person", type=int, default=1)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 8, 32, 128])
+    parser.add_argument("--precisions", nargs="+", default=["float16", "int8"])
+    parser.add_argument("--rerank", type=int, default=16)
+    parser.add_argument("--min-rows", type=int, default=0,
+                        help="quantize from this gallery size (default 0: always, to find the crossover)")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'identities':>10} {'backend':>12} {'build s':>8} {'ms/query':>9} {'recall@1':>9} {'scan MB':>8}")
+    for size in args.sizes:
+        centres, encodings = synthetic_gallery(size, args.images_per_person, rng)
+        queries = noisy_queries(centres, args.queries, rng)
+
+        exact = ExactIndex()
+        exact_ms, truth = time_lookups(exact, encodings, queries)
+        print(f"{size:>10} {'exact':>12} {0.0:>8.2f} {exact_ms:>9.3f} {1.0:>9.3f} {encodings.nbytes / 1e6:>8.1f}")
+
+        start = time.perf_counter()
+        ivf = IVFIndex(min_train=0).build(encodings)
+        build_s = time.perf_counter() - start
+        for nprobe in args.nprobe:
+            ivf.nprobe = nprobe
+            ivf_ms, found = time_lookups(ivf, encodings, queries)
+            recall = float(np.mean(found == truth))
+            print(f"{size:>10} {f'ivf/{nprobe}':>12} {build_s:>8.2f} {ivf_ms:>9.3f} {recall:>9.3f} {'':>8}")
+
+        for precision in args.precisions:
+            start = time.perf_counter()
+            quantized = QuantizedIndex(precision, args.rerank, min_rows=args.min_rows).build(encodings)
+            build_s = time.perf_counter() - start
+            quantized_ms, found = time_lookups(quantized, encodings, queries)
+            recall = float(np.mean(found == truth))
+            print(f"{size:>10} {precision:>12} {build_s:>8.2f} {quantized_ms:>9.3f} {recall:>9.3f} "
+                  f"{quantized.nbytes / 1e6:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
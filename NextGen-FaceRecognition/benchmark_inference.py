@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Benchmark optimized CPU inference of the InceptionResnetV1 embedder
+Aligned face crops are taken from the dataset. Every optimization set
+(see fast_inference.py) is timed per face at batch size 1 and
+--batch, and compared with the fp32 model: L2 drift of the unit
+embeddings and whether each face still has the same nearest neighbour
+among the other dataset faces.
+
+    python benchmark_inference.py
+    python benchmark_inference.py --threads 4 --sets int8 int8,channels_last,script compile
+"""
+import argparse
+import os
+import time
+import cv2
+import numpy as np
+import torch
+from facenet_pytorch import InceptionResnetV1
+from alignment import align_faces, prewhiten
+from augmentation import embed_faces
+from face_engine import EngineConfig, detect_faces, make_detector
+from fast_inference import optimize_embedder
+
+DEFAULT_SETS = ["int8", "channels_last", "script", "int8,channels_last,script"]
+
+
+def load_crops(dataset, config):
+    """(N, 3, 160, 160) aligned crops of the largest face in every dataset image"""
+    mtcnn = make_detector(config, torch.device("cpu"))
+    crops = []
+    for person in sorted(os.listdir(dataset)):
+        folder = os.path.join(dataset, person)
+        if not os.path.isdir(folder):
+            continue
+        for filename in sorted(os.listdir(folder)):
+            img = cv2.imread(os.path.join(folder, filename))
+            if img is None:
+                continue
+            rgb = np.ascontiguousarray(img[:, :, ::-1])
+            boxes, landmarks = detect_faces(mtcnn, rgb)
+            if boxes is not None:
+                crops.append(align_faces(rgb, boxes[:1], landmarks[:1], config.margin,
+                                         mtcnn.image_size, torch.device("cpu")))
+    return torch.cat(crops) if crops else None
+
+
+def ms_per_face(model, faces, batch, repeats):
+    embed_faces(model, torch.device("cpu"), faces[:batch])  # warm-up
+    started = time.perf_counter()
+    count = 0
+    for _ in range(repeats):
+        for start in range(0, len(faces), batch):
+            count += len(embed_faces(model, torch.device("cpu"), faces[start:start + batch]))
+    return (time.perf_counter() - started) * 1000 / count
+
+
+def nearest(embeddings):
+    """Index of every row's nearest other row"""
+    sims = embeddings @ embeddings.T
+    np.fill_diagonal(sims, -np.inf)
+    return sims.argmax(axis=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dataset", default="dataset")
+    parser.add_argument("--sets", nargs="+", default=DEFAULT_SETS,
+                        help="comma-separated optimization sets to compare with fp32")
+    parser.add_argument("--threads", type=int, default=torch.get_num_threads())
+    parser.add_argument("--batch", type=int, default=8)
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+
+    faces = load_crops(args.dataset, EngineConfig(dataset_path=args.dataset))
+    if faces is None:
+        print(f"❌ No faces found in {args.dataset}")
+        return
+    resnet = InceptionResnetV1(pretrained='vggface2').eval()
+    reference = embed_faces(resnet, torch.device("cpu"), faces)
+    reference_nearest = nearest(reference)
+    print(f"{len(faces)} faces, {args.threads} torch threads")
+
+    print(f"{'optimizations':<28} {'ms/face b=1':>11} {f'b={args.batch}':>8} {'speedup':>8} "
+          f"{'mean drift':>10} {'max drift':>10} {'same NN':>8}")
+    baseline = None
+    for name in ["fp32"] + args.sets:
+        if name == "fp32":
+            model, applied = resnet, ("fp32",)
+        else:
+            model, applied = optimize_embedder(resnet, name, prewhiten(faces[:args.batch]))
+            if not applied:
+                continue
+        single = ms_per_face(model, faces, 1, args.repeats)
+        batched = ms_per_face(model, faces, args.batch, args.repeats)
+        baseline = baseline or batched
+        embeddings = embed_faces(model, torch.device("cpu"), faces)
+        drift = np.linalg.norm(embeddings - reference, axis=1)
+        same = np.mean(nearest(embeddings) == reference_nearest)
+        print(f"{','.join(applied):<28} {single:>11.1f} {batched:>8.1f} {baseline / batched:>7.2f}x "
+              f"{drift.mean():>10.4f} {drift.max():>10.4f} {same:>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Compare the torch and ONNX Runtime backends (parity, startup, latency, RSS)
+Each runtime runs in a fresh process that builds a FaceEngine (startup
+time and peak RSS include the imports), then detects and embeds every
+dataset image at a webcam width. The parent checks that both runtimes
+find the same faces and produce the same embeddings, also on two sets
+with the same face count in every frame (one photo repeated, blank
+frames), and exits non-zero when they do not. Export the models first
+with export_onnx.py.
+
+    python benchmark_runtime.py
+    python benchmark_runtime.py --width 640 --repeats 3 --threads 2
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+
+RUNTIMES = ("torch", "onnx")
+# Largest accepted L2 distance between the two runtimes' unit embeddings
+# and box coordinate difference in pixels
+EMBEDDING_TOLERANCE = 1e-3
+BOX_TOLERANCE = 0.5
+# Frames in each uniform face count set
+UNIFORM_FRAMES = 4
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024  # bytes on macOS, KiB on Linux
+
+
+def object_array(items):
+    """1-D object array of per-frame arrays (np.array would stack equal shapes into one array)"""
+    array = np.empty(len(items), dtype=object)
+    for i, item in enumerate(items):
+        array[i] = item
+    return array
+
+
+def frame_sets(dataset, width):
+    """Set name -> RGB frames; "repeated" and "blank" have the same face count in every frame"""
+    from benchmark_detection import build_frames
+    frames = [rgb for _, rgb in build_frames(dataset, width, [1.0])]
+    return {
+        "dataset": frames,
+        "repeated": frames[:1] * UNIFORM_FRAMES,
+        "blank": [np.full_like(frames[0], 128)] * UNIFORM_FRAMES,
+    }
+
+
+def run_child(args):
+    """Measure one runtime in this process and save the results to args.output"""
+    started = time.perf_counter()
+    from face_engine import EngineConfig, FaceEngine
+    engine = FaceEngine(EngineConfig(dataset_path=args.dataset, runtime=args.child, onnx_dir=args.onnx_dir,
+                                     torch_threads=args.threads))
+    startup = time.perf_counter() - started
+    startup_rss = peak_rss_mb()
+
+    sets = frame_sets(args.dataset, args.width)
+    timings = {"detect": 0.0, "embed": 0.0, "faces": 0}
+    results = {}
+    for name, frames in sets.items():
+        boxes, embeddings = [], []
+        # Only the dataset frames are timed
+        for repeat in range(args.repeats if name == "dataset" else 1):
+            for rgb in frames:
+                started = time.perf_counter()
+                frame_boxes, landmarks = engine.detect(rgb)
+                detected = time.perf_counter()
+                frame_embeddings = np.zeros((0, 512), np.float32)
+                if frame_boxes is not None:
+                    faces, _ = engine.extract(rgb, frame_boxes, landmarks)
+                    frame_embeddings = engine.embed(faces)
+                if name == "dataset":
+                    timings["faces"] += len(frame_embeddings)
+                    timings["detect"] += detected - started
+                    timings["embed"] += time.perf_counter() - detected
+                if repeat == 0:
+                    boxes.append(np.zeros((0, 4)) if frame_boxes is None else np.asarray(frame_boxes, float))
+                    embeddings.append(frame_embeddings)
+        results[f"boxes_{name}"] = object_array(boxes)
+        results[f"embeddings_{name}"] = object_array(embeddings)
+
+    stats = {
+        "startup_s": startup,
+        "startup_rss_mb": startup_rss,
+        "peak_rss_mb": peak_rss_mb(),
+        "detect_ms": timings["detect"] * 1000 / (len(sets["dataset"]) * args.repeats),
+        "embed_ms": timings["embed"] * 1000 / max(1, timings["faces"]),
+        "frames": len(sets["dataset"]),
+        "sets": list(sets),
+        "torch_imported": "torch" in sys.modules,
+    }
+    np.savez(args.output, stats=json.dumps(stats), **results)
+
+
+def measure(runtime, args, directory):
+    output = os.path.join(directory, f"{runtime}.npz")
+    command = [sys.executable, os.path.abspath(__file__), "--child", runtime, "--output", output,
+               "--dataset", args.dataset, "--onnx-dir", args.onnx_dir, "--width", str(args.width),
+               "--repeats", str(args.repeats), "--threads", str(args.threads)]
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    with np.load(output, allow_pickle=True) as data:
+        stats = json.loads(str(data["stats"]))
+        frames = {name: (list(data[f"boxes_{name}"]), list(data[f"embeddings_{name}"])) for name in stats["sets"]}
+        return stats, frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--dataset", default="dataset")
+    parser.add_argument("--onnx-dir", default=os.path.join("models", "onnx"))
+    parser.add_argument("--width", type=int, default=1280, help="camera frame width")
+    parser.add_argument("--repeats", type=int, default=1)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--child", choices=RUNTIMES, help=argparse.SUPPRESS)
+    parser.add_argument("--output", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        run_child(args)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        results = {runtime: measure(runtime, args, directory) for runtime in RUNTIMES}
+
+    print(f"{results['torch'][0]['frames']} frames {args.width}px wide, {args.threads} threads")
+    print(f"{'runtime':<8} {'startup s':>9} {'RSS MB':>7} {'peak RSS MB':>11} {'detect ms':>9} "
+          f"{'embed ms/face':>13} {'torch':>6}")
+    for runtime, (stats, _) in results.items():
+        print(f"{runtime:<8} {stats['startup_s']:>9.2f} {stats['startup_rss_mb']:>7.0f} "
+              f"{stats['peak_rss_mb']:>11.0f} {stats['detect_ms']:>9.1f} {stats['embed_ms']:>13.1f} "
+              f"{'yes' if stats['torch_imported'] else 'no':>6}")
+
+    # Parity per frame set: same faces, same boxes, same embeddings
+    failed = False
+    for name, (torch_boxes, torch_embeddings) in results["torch"][1].items():
+        onnx_boxes, onnx_embeddings = results["onnx"][1][name]
+        mismatched = sum(len(a) != len(b) for a, b in zip(torch_boxes, onnx_boxes))
+        pairs = [(a, b) for a, b in zip(torch_boxes, onnx_boxes) if len(a) == len(b) and len(a)]
+        box_error = max((np.abs(a - b).max() for a, b in pairs), default=0.0)
+        drift = max((np.linalg.norm(a - b, axis=1).max()
+                     for a, b in zip(torch_embeddings, onnx_embeddings) if len(a) == len(b) and len(a)),
+                    default=0.0)
+        print(f"Parity ({name}, {len(torch_boxes)} frames): {mismatched} frames with a different face count, "
+              f"max box difference {box_error:.3f}px, max embedding L2 difference {drift:.2e}")
+        failed = failed or mismatched or box_error > BOX_TOLERANCE or drift > EMBEDDING_TOLERANCE
+    if failed:
+        print("❌ ONNX Runtime results differ from torch")
+        sys.exit(1)
+    print("✅ ONNX Runtime matches torch")
+
+
+if __name__ == "__main__":
+    main()
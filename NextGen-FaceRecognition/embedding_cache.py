@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Persistent on-disk embedding cache for the face recognition dataset
+Stores every image's embeddings in one .npz file plus a JSON manifest
+(content hash, mtime, size, model version) so warm restarts skip MTCNN
+and InceptionResnetV1 for images that have not changed
+"""
+import os
+import json
+import hashlib
+import numpy as np
+
+CACHE_DIR = ".embedding_cache"
+# Bump when the detector/embedder or the crop preprocessing changes
+MODEL_VERSION = "facenet-vggface2-v1"
+EMBEDDING_DIM = 512
+
+
+def file_sha1(path):
+    """Content hash of an image file"""
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Maps image path -> (k, 512) float32 embeddings.
+    k is 0 for images where no face was found, so those are not
+    re-detected on every start either.
+    """
+
+    def __init__(self, variant, cache_dir=CACHE_DIR, model_version=MODEL_VERSION):
+        self.variant = variant
+        self.version = f"{model_version}:{variant}"
+        self.npz_path = os.path.join(cache_dir, f"{variant}.npz")
+        self.manifest_path = os.path.join(cache_dir, f"{variant}.json")
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not (os.path.exists(self.manifest_path) and os.path.exists(self.npz_path)):
+            return
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+            if manifest.get("version") != self.version:
+                print(f"♻️  Embedding cache version changed, rebuilding: {self.variant}")
+                return
+            if file_sha1(self.npz_path) != manifest.get("npz_sha1"):
+                raise ValueError("manifest and embeddings are out of sync")
+            with np.load(self.npz_path) as data:
+                embeddings = data["embeddings"].astype(np.float32, copy=False)
+            if len(embeddings) != manifest.get("rows"):
+                raise ValueError("manifest and embeddings are out of sync")
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠️  Ignoring unreadable embedding cache: {e}")
+            return
+
+        for path, entry in manifest.get("images", {}).items():
+            start, count = entry["rows"]
+            self.entries[path] = {
+                "sha1": entry["sha1"],
+                "mtime": entry["mtime"],
+                "size": entry["size"],
+                "embeddings": embeddings[start:start + count],
+            }
+
+    def reload(self):
+        """Re-read the cache from disk, e.g. after another process saved it"""
+        self.entries = {}
+        self._dirty = False
+        self._load()
+
+    def lookup(self, img_path):
+        """Return cached embeddings for an unchanged image, or None"""
+        entry = self.entries.get(img_path)
+        if entry is None:
+            self.misses += 1
+            return None
+
+        try:
+            stat = os.stat(img_path)
+            # Touched on disk - only trust the cache if the content is identical
+            touched = stat.st_mtime != entry["mtime"] or stat.st_size != entry["size"]
+            if touched and file_sha1(img_path) != entry["sha1"]:
+                self.misses += 1
+                return None
+        except OSError:
+            # Deleted or unreadable since it was listed: the pipeline reports it
+            self.misses += 1
+            return None
+        if touched:
+            entry["mtime"], entry["size"] = stat.st_mtime, stat.st_size
+            self._dirty = True
+
+        self.hits += 1
+        return entry["embeddings"]
+
+    def store(self, img_path, embeddings):
+        """Record freshly computed embeddings (may be empty) for an image"""
+        try:
+            stat = os.stat(img_path)
+            sha1 = file_sha1(img_path)
+        except OSError:
+            return  # deleted since it was decoded; nothing to cache
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, EMBEDDING_DIM)
+        self.entries[img_path] = {
+            "sha1": sha1,
+            "mtime": stat.st_mtime,
+            "size": stat.st_size,
+            "embeddings": embeddings,
+        }
+        self._dirty = True
+
+    def remove(self, img_path):
+        if self.entries.pop(img_path, None) is not None:
+            self._dirty = True
+
+    def prune(self, keep_paths):
+        """Drop entries for images that no longer exist in the dataset"""
+        keep_paths = set(keep_paths)
+        for path in list(self.entries):
+            if path not in keep_paths:
+                self.remove(path)
+
+    def save(self):
+        """Write the .npz and manifest (each replaced atomically, checked together on load)"""
+        if not self._dirty:
+            return
+
+        os.makedirs(os.path.dirname(self.npz_path) or ".", exist_ok=True)
+        images = {}
+        blocks = []
+        row = 0
+        for path, entry in self.entries.items():
+            count = len(entry["embeddings"])
+            images[path] = {
+                "sha1": entry["sha1"],
+                "mtime": entry["mtime"],
+                "size": entry["size"],
+                "rows": [row, count],
+            }
+            blocks.append(entry["embeddings"])
+            row += count
+
+        embeddings = np.concatenate(blocks) if blocks else np.zeros((0, EMBEDDING_DIM), np.float32)
+
+        # Per-process temp names: two services sharing the directory must not
+        # replace each other's half-written files
+        tmp_npz = f"{self.npz_path}.{os.getpid()}.tmp"
+        with open(tmp_npz, "wb") as f:
+            np.savez(f, embeddings=embeddings)
+        tmp_manifest = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_manifest, "w") as f:
+            # The npz hash ties the manifest to exactly this matrix, so a
+            # manifest paired with another save's npz is rejected on load
+            json.dump({"version": self.version, "rows": row, "npz_sha1": file_sha1(tmp_npz),
+                       "images": images}, f)
+
+        os.replace(tmp_npz, self.npz_path)
+        os.replace(tmp_manifest, self.manifest_path)
+        self._dirty = False
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def summary(self):
+        return f"cache hits: {self.hits}, recomputed: {self.misses}"
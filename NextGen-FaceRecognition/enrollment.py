@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Staged, batched dataset embedding pipeline for enrollment
+1. decode JPEGs in a thread pool (cv2.imdecode releases the GIL)
+2. run MTCNN on batches of same-size images
+   and extract each image's aligned face (alignment.py)
+3. embed the faces with InceptionResnetV1 in configurable batches
+Cached images (see embedding_cache.py) skip all three stages. Decoding of
+the next chunk overlaps detection/embedding of the current one.
+"""
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from alignment import align_faces, concat_faces
+from augmentation import embed_faces
+
+DECODE_WORKERS = min(8, os.cpu_count() or 1)
+DETECT_BATCH = 4
+EMBED_BATCH = 32
+# Images decoded per chunk; two chunks are resident at once, so this bounds
+# peak memory (a 12MP phone photo is ~36MB decoded)
+CHUNK_SIZE = 32
+# run() result for an image file that could not be read or decoded
+UNREADABLE = "unreadable"
+
+
+def decode_image_file(img_path):
+    """Read an image file to an RGB array, or None if unreadable"""
+    try:
+        data = np.fromfile(img_path, dtype=np.uint8)
+    except OSError:
+        return None
+    img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return np.ascontiguousarray(img[:,:,::-1])  # BGR -> RGB
+
+
+class EnrollmentStats:
+    """Per-stage wall time and throughput for one pipeline run"""
+
+    def __init__(self):
+        self.images = 0
+        self.cached = 0
+        self.faces = 0
+        self.unreadable = 0
+        self.stage_seconds = defaultdict(float)
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    def report(self):
+        rate = self.images / self.elapsed if self.elapsed > 0 else 0.0
+        stages = ", ".join(f"{stage} {secs:.1f}s" for stage, secs in self.stage_seconds.items())
+        return (f"{self.images} images ({self.cached} cached, {self.faces} faces, "
+                f"{self.unreadable} unreadable) in "
+                f"{self.elapsed:.1f}s = {rate:.1f} images/sec [{stages}]")
+
+
+class EnrollmentPipeline:
+    """
+    Embeds dataset images in batches. `run(paths)` returns a dict
+    img_path -> (A, 512) float32 embeddings (one row per augmentation),
+    None when no face was found, or UNREADABLE when the file could not be
+    read or decoded (not cached, so a replaced file is picked up).
+    """
+
+    def __init__(self, mtcnn, resnet, device, embedding_cache=None,
+                 decode_workers=DECODE_WORKERS, detect_batch=DETECT_BATCH,
+                 embed_batch=EMBED_BATCH, chunk_size=CHUNK_SIZE,
+                 augmentations=("original",)):
+        self.mtcnn = mtcnn
+        self.resnet = resnet
+        self.device = device
+        self.embedding_cache = embedding_cache
+        self.augmentations = tuple(augmentations)
+        self.decode_workers = decode_workers
+        self.detect_batch = detect_batch
+        self.embed_batch = embed_batch
+        self.chunk_size = chunk_size
+        self.stats = EnrollmentStats()
+
+    def _detect(self, decoded):
+        """Batched MTCNN over images grouped by shape -> {path: (1, 3, 160, 160) aligned face}"""
+        by_shape = defaultdict(list)
+        for img_path, img in decoded:
+            by_shape[img.shape].append((img_path, img))
+
+        crops = {}
+        for group in by_shape.values():
+            for start in range(0, len(group), self.detect_batch):
+                batch = group[start:start + self.detect_batch]
+                batch_boxes, _, batch_points = self.mtcnn.detect([img for _, img in batch], landmarks=True)
+                for (img_path, img), boxes, points in zip(batch, batch_boxes, batch_points):
+                    if boxes is None:
+                        crops[img_path] = None
+                        continue
+                    # Largest face only
+                    crops[img_path] = align_faces(img, boxes[:1], points[:1], self.mtcnn.margin,
+                                                  self.mtcnn.image_size, self.device)
+        return crops
+
+    def _embed(self, faces):
+        """Embed n aligned (1, 3, 160, 160) faces in batches -> (n, A, 512) unit vectors"""
+        # embed_batch counts forward-pass rows, i.e. crops x augmentations
+        per_batch = max(1, self.embed_batch // len(self.augmentations))
+        embeddings = [
+            embed_faces(self.resnet, self.device, concat_faces(faces[start:start + per_batch]), self.augmentations)
+            for start in range(0, len(faces), per_batch)
+        ]
+        return np.concatenate(embeddings).reshape(len(faces), len(self.augmentations), -1)
+
+    def _process_chunk(self, decoded, results):
+        started = time.perf_counter()
+        crops = self._detect(decoded)
+        self.stats.stage_seconds["detect"] += time.perf_counter() - started
+
+        face_paths = [path for path, crop in crops.items() if crop is not None]
+        for img_path, crop in crops.items():
+            if crop is None:
+                results[img_path] = None
+                if self.embedding_cache is not None:
+                    self.embedding_cache.store(img_path, [])
+
+        if face_paths:
+            started = time.perf_counter()
+            embeddings = self._embed([crops[path] for path in face_paths])
+            self.stats.stage_seconds["embed"] += time.perf_counter() - started
+            for img_path, image_embeddings in zip(face_paths, embeddings):
+                results[img_path] = image_embeddings
+                if self.embedding_cache is not None:
+                    self.embedding_cache.store(img_path, image_embeddings)
+            self.stats.faces += len(face_paths)
+
+    def _decode_chunk(self, pool, paths):
+        """([(path, RGB image)], [paths that could not be decoded])"""
+        started = time.perf_counter()
+        images = list(pool.map(decode_image_file, paths))
+        self.stats.stage_seconds["decode"] += time.perf_counter() - started
+        decoded = [(path, img) for path, img in zip(paths, images) if img is not None]
+        return decoded, [path for path, img in zip(paths, images) if img is None]
+
+    def run(self, img_paths, progress=True):
+        self.stats = EnrollmentStats()
+        results = {}
+        pending = []
+        for img_path in img_paths:
+            self.stats.images += 1
+            cached = self.embedding_cache.lookup(img_path) if self.embedding_cache is not None else None
+            if cached is not None:
+                results[img_path] = cached if len(cached) else None
+                self.stats.cached += 1
+            else:
+                pending.append(img_path)
+
+        chunks = [pending[i:i + self.chunk_size] for i in range(0, len(pending), self.chunk_size)]
+        with ThreadPoolExecutor(max_workers=self.decode_workers) as pool, \
+                ThreadPoolExecutor(max_workers=1) as prefetch:
+            next_chunk = prefetch.submit(self._decode_chunk, pool, chunks[0]) if chunks else None
+            for i in range(len(chunks)):
+                decoded, unreadable = next_chunk.result()
+                for img_path in unreadable:
+                    results[img_path] = UNREADABLE
+                self.stats.unreadable += len(unreadable)
+                # Start decoding the next chunk while this one is detected/embedded
+                if i + 1 < len(chunks):
+                    next_chunk = prefetch.submit(self._decode_chunk, pool, chunks[i + 1])
+                self._process_chunk(decoded, results)
+                if progress:
+                    done = self.stats.cached + sum(len(c) for c in chunks[:i + 1])
+                    print(f"  ⏳ {done}/{self.stats.images} images, "
+                          f"{done / self.stats.elapsed:.1f} images/sec")
+
+        if progress:
+            print(f"⚡ Enrollment: {self.stats.report()}")
+        return results
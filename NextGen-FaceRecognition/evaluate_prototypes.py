@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Compare per-image and prototype (centroid) galleries on the dataset
+Leave-one-image-out: every photo is matched against a gallery built from
+all the other photos. Also reports the false-accept rate when a person's
+photos are matched against a gallery that does not contain them.
+
+    python evaluate_prototypes.py --k 1 2 3
+"""
+import argparse
+import time
+import numpy as np
+from face_engine import FaceEngine, EngineConfig
+from gallery import FaceGallery
+
+THRESHOLD = EngineConfig.threshold  # same as the service's recognition threshold
+
+
+def evaluate(encodings, labels, k):
+    """Returns (top-1 accuracy, accept rate, false-accept rate, avg gallery rows, ms/match)"""
+    correct = accepted = rows = 0
+    elapsed = 0.0
+    for i in range(len(labels)):
+        rest = np.arange(len(labels)) != i
+        gallery = FaceGallery()
+        gallery.add(encodings[rest], list(labels[rest]))
+        if k:
+            gallery = gallery.to_prototypes(k)
+        rows += len(gallery)
+
+        snapshot = gallery.snapshot()
+        start = time.perf_counter()
+        name, distance = snapshot.match(encodings[i])
+        elapsed += time.perf_counter() - start
+        correct += name == labels[i]
+        accepted += name == labels[i] and distance < THRESHOLD
+
+    false_accepts = impostor_queries = 0
+    for person in dict.fromkeys(labels):
+        others = labels != person
+        gallery = FaceGallery()
+        gallery.add(encodings[others], list(labels[others]))
+        if k:
+            gallery = gallery.to_prototypes(k)
+        for match in gallery.snapshot().match_batch(encodings[~others]):
+            false_accepts += match.distance < THRESHOLD
+            impostor_queries += 1
+
+    n = len(labels)
+    return correct / n, accepted / n, false_accepts / impostor_queries, rows / n, elapsed * 1000 / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--k", type=int, nargs="+", default=[1, 2, 3],
+                        help="prototypes per person to evaluate")
+    args = parser.parse_args()
+
+    engine = FaceEngine(EngineConfig(gallery_mode="images"))
+    if not engine.load_dataset():
+        print("❌ No embeddings loaded - check the dataset folder")
+        return
+
+    snapshot = engine.gallery.snapshot()
+    encodings = np.array(snapshot.encodings)
+    labels = np.array(snapshot.labels)
+
+    print(f"\n📊 {len(set(labels))} people, {len(labels)} photos, threshold {THRESHOLD}")
+    print(f"{'gallery':>14} {'top-1':>7} {'accept':>7} {'FAR':>7} {'rows':>7} {'ms/match':>9}")
+    for k in [0] + args.k:
+        top1, accept, far, rows, ms = evaluate(encodings, labels, k)
+        mode = "per-image" if k == 0 else f"prototypes/{k}"
+        print(f"{mode:>14} {top1:>7.3f} {accept:>7.3f} {far:>7.3f} {rows:>7.1f} {ms:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
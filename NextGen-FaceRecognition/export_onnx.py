@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Export the face models to ONNX for the ONNX Runtime backend
+Writes embedder.onnx (InceptionResnetV1, vggface2) and MTCNN's pnet.onnx,
+rnet.onnx and onet.onnx, then runs every file through ONNX Runtime and
+compares it with the torch module on random inputs of a different size
+than the one traced. Serve them with FACE_RUNTIME=onnx (FACE_ONNX_DIR);
+only this script needs torch.
+benchmark_runtime.py checks parity on real faces.
+
+    python export_onnx.py
+    python export_onnx.py --output /opt/riva/onnx
+"""
+import argparse
+import os
+import sys
+import numpy as np
+import torch
+from facenet_pytorch import InceptionResnetV1
+from face_engine import EngineConfig, make_detector
+from onnx_backend import OPSET, EMBEDDER, DETECTOR_NETS, NETS, OnnxSession, model_path
+
+# Inputs the parity check runs both versions on (not the traced shapes)
+CHECK_SHAPES = {
+    EMBEDDER: (5, 3, 160, 160),
+    "pnet": (3, 3, 217, 163),
+    "rnet": (7, 3, 24, 24),
+    "onet": (7, 3, 48, 48),
+}
+TOLERANCE = 1e-4
+
+
+def export_model(module, name, directory, opset=OPSET):
+    """Write one of NETS to <directory>/<name>.onnx; returns the path"""
+    shape, outputs, axes = NETS[name]
+    path = model_path(directory, name)
+    os.makedirs(directory, exist_ok=True)
+    # Outputs vary along the same axes as the input (P-Net maps are smaller)
+    dynamic_axes = {output: axes for output in ["input"] + outputs}
+    # TorchScript-based exporter: dynamic axes without extra dependencies
+    torch.onnx.export(module.eval(), (torch.rand(*shape),), path, input_names=["input"],
+                      output_names=outputs, dynamic_axes=dynamic_axes,
+                      opset_version=opset, dynamo=False)
+    return path
+
+
+def max_difference(module, session, inputs):
+    """Largest absolute output difference between a torch module and its export"""
+    with torch.inference_mode():
+        expected = module(inputs)
+    actual = session(inputs.numpy())
+    if isinstance(expected, torch.Tensor):
+        expected, actual = (expected,), (actual,)
+    return max(float(np.abs(a - e.numpy()).max()) for a, e in zip(actual, expected))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--output", default=EngineConfig().onnx_dir)
+    parser.add_argument("--opset", type=int, default=OPSET)
+    args = parser.parse_args()
+
+    mtcnn = make_detector(EngineConfig(runtime="torch"), torch.device("cpu"))
+    modules = {EMBEDDER: InceptionResnetV1(pretrained='vggface2').eval()}
+    modules.update({name: getattr(mtcnn, name) for name in DETECTOR_NETS})
+
+    failed = False
+    for name, module in modules.items():
+        path = export_model(module, name, args.output, args.opset)
+        # Pre-whitened faces / MTCNN-normalized pixels are roughly in [-1, 1]
+        inputs = torch.rand(*CHECK_SHAPES[name]) * 2 - 1
+        difference = max_difference(module, OnnxSession(path), inputs)
+        ok = difference <= TOLERANCE
+        failed = failed or not ok
+        print(f"{'✅' if ok else '❌'} {path}: max |onnx - torch| = {difference:.2e}")
+
+    if failed:
+        print(f"❌ Exported outputs differ from torch by more than {TOLERANCE}")
+        sys.exit(1)
+    print(f"🎯 Run with FACE_RUNTIME=onnx FACE_ONNX_DIR={args.output}")
+
+
+if __name__ == "__main__":
+    main()
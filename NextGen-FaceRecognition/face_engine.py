@@ -0,0 +1,477 @@
+#!/usr/bin/env python3
+"""
+Shared face recognition engine for every RIVA entry point
+Owns the MTCNN detector, the InceptionResnetV1 embedder (always run under
+torch.inference_mode, optionally as an optimized CPU copy, or exported
+to ONNX Runtime together with the detector), the on-disk embedding
+cache, the enrollment pipeline and the gallery/matcher. Configure it
+once with EngineConfig. torch is only imported by the torch runtime.
+"""
+import contextlib
+import hashlib
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+from dataclasses import dataclass, field
+import cv2
+import numpy as np
+from embedding_cache import CACHE_DIR, EmbeddingCache
+from gallery import FaceGallery, compute_prototypes
+from ann_index import make_index
+from enrollment import UNREADABLE, EnrollmentPipeline
+from alignment import ALIGNMENT_REVISION, align_faces, prewhiten
+from augmentation import embed_faces
+from micro_batcher import MicroBatcher
+from shared_gallery import SharedGallery
+from onnx_backend import OnnxDetector, load_embedder
+
+
+@dataclass
+class EngineConfig:
+    dataset_path: str = "dataset"
+    # Recognition threshold on the L2 distance between unit embeddings
+    threshold: float = 0.8
+    device: str = None  # None = CUDA when available, else CPU
+    # "torch", or "onnx" to run the networks exported by export_onnx.py
+    # (files in onnx_dir) through ONNX Runtime on CPU, with the MTCNN and
+    # alignment steps in numpy: torch is not imported and `device` is ignored
+    runtime: str = "torch"
+    onnx_dir: str = os.path.join("models", "onnx")
+    # MTCNN
+    margin: int = 30
+    min_face_size: int = 40
+    detector_thresholds: tuple = (0.7, 0.8, 0.8)
+    # Live frames are detected on a copy downscaled by this factor; faces
+    # are still cropped from the full-resolution frame. The smallest
+    # detectable face becomes min_face_size / detection_scale pixels.
+    detection_scale: float = 1.0
+    # Augmentations stored per enrollment image / averaged at recognition (TTA)
+    enroll_augmentations: tuple = ("original",)
+    recognition_augmentations: tuple = ("original",)
+    # Matcher: "exact", "ivf" or "quantized" index, "images" or "prototypes" gallery
+    index_backend: str = "exact"
+    index_params: dict = field(default_factory=dict)
+    gallery_mode: str = "images"
+    prototypes_per_person: int = 1
+    # Coalesce face crops of concurrent recognize() calls into one forward
+    # pass of up to this many faces (0 = every call embeds on its own)
+    embed_batch_size: int = 0
+    embed_batch_wait_ms: float = 3.0
+    # Directory of a memory-mapped gallery shared with other processes on
+    # this host (shared_gallery.py); None keeps the gallery private
+    shared_gallery: str = None
+    # Optimized CPU embedder for live recognition (fast_inference.py): any
+    # of "int8", "channels_last", "script", "compile". Enrollment keeps the
+    # fp32 model. The first drift_samples live faces are embedded by both
+    # and the fp32 model is used again if they drift beyond the limit.
+    embedder_optimizations: tuple = ()
+    drift_samples: int = 64
+    max_embedding_drift: float = 0.05
+    # torch / ONNX Runtime intra-op threads (0 = library default)
+    torch_threads: int = 0
+
+    @classmethod
+    def from_env(cls, **overrides):
+        """Defaults, then FACE_* environment variables, then explicit overrides"""
+        config = cls(
+            runtime=os.environ.get("FACE_RUNTIME", "torch"),
+            onnx_dir=os.environ.get("FACE_ONNX_DIR", os.path.join("models", "onnx")),
+            index_backend=os.environ.get("FACE_INDEX_BACKEND", "exact"),
+            gallery_mode=os.environ.get("FACE_GALLERY_MODE", "images"),
+            prototypes_per_person=int(os.environ.get("FACE_PROTOTYPES_K", "1")),
+            detection_scale=float(os.environ.get("FACE_DETECTION_SCALE", "1.0")),
+            shared_gallery=os.environ.get("FACE_SHARED_GALLERY") or None,
+            # Names are checked by fast_inference when the torch embedder is optimized
+            embedder_optimizations=tuple(filter(None, map(str.strip,
+                                                          os.environ.get("FACE_EMBEDDER_OPTIMIZE", "").split(",")))),
+            max_embedding_drift=float(os.environ.get("FACE_MAX_EMBEDDING_DRIFT", "0.05")),
+            torch_threads=int(os.environ.get("FACE_TORCH_THREADS", "0")),
+        )
+        if config.index_backend == "ivf":
+            config.index_params = {"nprobe": int(os.environ.get("FACE_IVF_NPROBE", "8"))}
+        elif config.index_backend == "quantized":
+            config.index_params = {"precision": os.environ.get("FACE_INDEX_PRECISION", "int8"),
+                                   "rerank": int(os.environ.get("FACE_INDEX_RERANK", "16")),
+                                   # 0 = ann_index.MIN_QUANTIZED_ROWS for the precision
+                                   "min_rows": int(os.environ.get("FACE_INDEX_MIN_ROWS", "0")) or None,
+                                   # On disk, not /tmp (often RAM-backed tmpfs)
+                                   "storage_dir": os.environ.get("FACE_INDEX_STORAGE", CACHE_DIR)}
+        for key, value in overrides.items():
+            setattr(config, key, value)
+        return config
+
+
+# One detected face: name is None when the best match is above the threshold;
+# track_id is set when recognizing with a FaceTracker
+RecognizedFace = namedtuple("RecognizedFace", ["name", "distance", "confidence", "box", "match", "track_id"],
+                            defaults=(None,))
+
+
+def clamp_box(box, shape):
+    """Integer x1, y1, x2, y2 clamped to an image of the given shape"""
+    x1, y1, x2, y2 = box
+    return max(0, int(x1)), max(0, int(y1)), min(shape[1], int(x2)), min(shape[0], int(y2))
+
+
+def make_detector(config, device):
+    settings = dict(
+        image_size=160,
+        margin=config.margin,
+        min_face_size=config.min_face_size,
+        thresholds=list(config.detector_thresholds),
+    )
+    if config.runtime == "onnx":
+        # MTCNN in numpy; the torch P/R/O-Nets are never built
+        return OnnxDetector(config.onnx_dir, threads=config.torch_threads, **settings)
+    from facenet_pytorch import MTCNN
+    return MTCNN(keep_all=True, device=device, **settings)
+
+
+def make_embedder(config, device):
+    if config.runtime == "onnx":
+        return load_embedder(config.onnx_dir, config.torch_threads)
+    if config.runtime != "torch":
+        raise ValueError(f"Unknown runtime: {config.runtime} (choose torch or onnx)")
+    from facenet_pytorch import InceptionResnetV1
+    return InceptionResnetV1(pretrained='vggface2').eval().to(device)
+
+
+def detect_faces(mtcnn, rgb, scale=1.0):
+    """
+    MTCNN boxes (F, 4) and landmarks (F, 5, 2) in full-frame coordinates,
+    detected on a copy of the frame downscaled by `scale`; (None, None)
+    when there is no face
+    """
+    if scale != 1.0:
+        small = cv2.resize(rgb, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        boxes, _, landmarks = mtcnn.detect(small, landmarks=True)
+        if boxes is not None:
+            # Per-axis factors, the resized size is rounded
+            sx, sy = small.shape[1] / rgb.shape[1], small.shape[0] / rgb.shape[0]
+            boxes = boxes / np.array([sx, sy, sx, sy])
+            landmarks = landmarks / np.array([sx, sy])
+        return boxes, landmarks
+    boxes, _, landmarks = mtcnn.detect(rgb, landmarks=True)
+    return boxes, landmarks
+
+
+class FaceEngine:
+    def __init__(self, config=None):
+        self.config = config or EngineConfig()
+        if self.config.runtime == "onnx":
+            # Faces are numpy arrays (tensor_device None) and ONNX Runtime runs on CPU
+            self.device, self.tensor_device = "cpu", None
+        else:
+            import torch
+            if self.config.device:
+                self.device = torch.device(self.config.device)
+            else:
+                self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+            self.tensor_device = self.device
+            if self.config.torch_threads > 0:
+                torch.set_num_threads(self.config.torch_threads)
+
+        self.mtcnn = make_detector(self.config, self.device)
+        self.resnet = make_embedder(self.config, self.device)
+        # Live recognition model: self.resnet or an optimized copy of it
+        self.embedder, self.drift = self._make_embedder()
+
+        self.embedding_cache = EmbeddingCache(self.cache_variant())
+        self.enrollment = EnrollmentPipeline(self.mtcnn, self.resnet, self.tensor_device, self.embedding_cache,
+                                             augmentations=self.config.enroll_augmentations)
+        self.gallery = self.new_gallery()
+        if self.config.shared_gallery:
+            self.gallery = SharedGallery(self.config.shared_gallery, self.cache_variant(),
+                                         index=make_index(self.config.index_backend, **self.config.index_params),
+                                         on_stale=self.embedding_cache.reload)
+        # Serializes dataset/gallery writers; recognition never takes it
+        self.lock = threading.RLock()
+
+        self._active = 0  # recognize() calls in flight
+        self._active_lock = threading.Lock()
+        self.batcher = self._make_batcher()
+
+    def _make_batcher(self):
+        if self.config.embed_batch_size <= 0:
+            return None
+        return MicroBatcher(self._embed_batch, self.config.embed_batch_size,
+                            self.config.embed_batch_wait_ms / 1000,
+                            expected=lambda: self._active)
+
+    def _make_embedder(self):
+        """(model for live recognition, DriftMonitor or None when it is the fp32 model)"""
+        if not self.config.embedder_optimizations:
+            return self.resnet, None
+        if self.config.runtime != "torch" or self.device.type != "cpu":
+            print(f"⚠️  Embedder optimizations are for torch CPU inference; "
+                  f"ignored with {self.config.runtime} on {self.device}")
+            return self.resnet, None
+        import torch
+        from fast_inference import DriftMonitor, optimize_embedder
+        example = prewhiten(torch.rand(4, 3, self.mtcnn.image_size, self.mtcnn.image_size))
+        embedder, applied = optimize_embedder(self.resnet, self.config.embedder_optimizations, example)
+        if not applied:
+            return self.resnet, None
+        print(f"⚡ Optimized embedder: {', '.join(applied)}")
+        return embedder, DriftMonitor(self.config.drift_samples, self.config.max_embedding_drift)
+
+    def embedder_summary(self):
+        if self.drift is None:
+            return "fp32" if self.config.runtime == "torch" else f"fp32 ({self.config.runtime})"
+        state = "optimized" if self.embedder is not self.resnet else "fp32 (optimized model drifted)"
+        return f"{state}, {self.drift.summary()}"
+
+    def after_fork(self, threads=None):
+        """
+        Call in a forked worker process: threads do not survive fork(), so
+        the locks, the batching thread and ONNX Runtime sessions are
+        recreated, with `threads` intra-op threads if given. Models and
+        gallery stay shared copy-on-write with the parent.
+        """
+        if self.config.runtime == "onnx":
+            for session in [self.resnet] + self.mtcnn.sessions:
+                session.reload(threads)
+        elif threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.lock = threading.RLock()
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self.batcher = self._make_batcher()
+
+    def cache_variant(self):
+        """
+        Embedding cache (and shared gallery) key. Covers every setting that
+        changes the enrolled crops or embeddings, so changing one of them
+        re-embeds the dataset instead of serving vectors made the old way.
+        """
+        config = self.config
+        augmentations = tuple(config.enroll_augmentations)
+        variant = "aligned160" if augmentations == ("original",) else "aligned160-aug-" + "-".join(augmentations)
+        settings = (self.mtcnn.image_size, config.margin, config.min_face_size,
+                    tuple(config.detector_thresholds), config.runtime, ALIGNMENT_REVISION)
+        return f"{variant}-{hashlib.sha1(repr(settings).encode()).hexdigest()[:8]}"
+
+    def new_gallery(self):
+        return FaceGallery(index=make_index(self.config.index_backend, **self.config.index_params))
+
+    @property
+    def loaded(self):
+        return len(self.gallery) > 0
+
+    @property
+    def shared(self):
+        return isinstance(self.gallery, SharedGallery)
+
+    def gallery_writes(self):
+        """Engine lock, plus the cross-process write lock with a shared gallery"""
+        stack = contextlib.ExitStack()
+        stack.enter_context(self.lock)
+        if self.shared:
+            stack.enter_context(self.gallery.lock())
+        return stack
+
+    def attach_shared_gallery(self):
+        """Serve the gallery another process already published, without scanning the dataset"""
+        if not self.shared or not self.gallery.attach():
+            return False
+        print(f"🔗 Using shared gallery: {len(self.gallery)} embeddings")
+        return self.loaded
+
+    # --------------------------
+    # Gallery management
+    # --------------------------
+    def _person_paths(self, person_name):
+        person_folder = os.path.join(self.config.dataset_path, person_name)
+        return [os.path.join(person_folder, img_name) for img_name in os.listdir(person_folder)]
+
+    def load_dataset(self):
+        """(Re)build the gallery from dataset/<person>/<images>; cached images are not re-embedded"""
+        dataset_path = self.config.dataset_path
+        if not os.path.exists(dataset_path):
+            print(f"❌ Dataset path not found: {dataset_path}")
+            return False
+
+        with self.gallery_writes():
+            print("🔄 Loading face embeddings...")
+            fresh_gallery = self.new_gallery()
+            self.embedding_cache.reset_stats()
+
+            person_paths = {
+                person_name: self._person_paths(person_name)
+                for person_name in os.listdir(dataset_path)
+                if os.path.isdir(os.path.join(dataset_path, person_name))
+            }
+            seen_paths = [path for paths in person_paths.values() for path in paths]
+            embeddings = self.enrollment.run(seen_paths)
+
+            for img_path, embedding in embeddings.items():
+                if embedding is UNREADABLE:
+                    print(f"  ⚠️  Cannot read {img_path}, skipping it")
+            for person_name, paths in person_paths.items():
+                person_embeddings = [embeddings[path] for path in paths
+                                     if isinstance(embeddings.get(path), np.ndarray)]
+                if person_embeddings:
+                    fresh_gallery.add(np.concatenate(person_embeddings), person_name)
+                print(f"  ✅ Loaded {len(person_embeddings)} images for {person_name}")
+
+            self.embedding_cache.prune(seen_paths)
+            self.embedding_cache.save()
+            print(f"💾 Embedding {self.embedding_cache.summary()}")
+
+            if self.config.gallery_mode == "prototypes":
+                fresh_gallery = fresh_gallery.to_prototypes(self.config.prototypes_per_person)
+            # Single reference swap: readers see the old or the new gallery, never a mix
+            if self.shared:
+                self.gallery.load(fresh_gallery)
+            else:
+                self.gallery = fresh_gallery
+
+        print(f"📊 Total people: {len(set(self.gallery.names))}")
+        print(f"📊 Total embeddings: {len(self.gallery)}")
+        return self.loaded
+
+    def enroll(self, person_name, img_paths):
+        """
+        Embed only the given dataset images of one person and add them to the
+        live gallery. Returns (embeddings added, paths that could not be
+        decoded or where no face was found).
+        """
+        with self.gallery_writes():
+            added, rejected = [], []
+            for img_path, embedding in self.enrollment.run(img_paths, progress=False).items():
+                if embedding is None or embedding is UNREADABLE:
+                    self.embedding_cache.remove(img_path)
+                    rejected.append(img_path)
+                else:
+                    added.append(embedding)
+            self.embedding_cache.save()
+
+            if added and self.config.gallery_mode == "prototypes":
+                # Recompute this person's centroids from all of their cached photos
+                cached = [self.embedding_cache.entries[path]["embeddings"]
+                          for path in self._person_paths(person_name)
+                          if path in self.embedding_cache.entries]
+                centroids, spread = compute_prototypes(np.concatenate(cached), self.config.prototypes_per_person)
+                self.gallery.replace(person_name, centroids, spread)
+            elif added:
+                self.gallery.add(np.concatenate(added), person_name)
+            return sum(len(embedding) for embedding in added), rejected
+
+    def remove_person(self, person_name, delete_files=True):
+        """Drop a person from the gallery (and their dataset folder); returns rows removed"""
+        with self.gallery_writes():
+            person_folder = os.path.join(self.config.dataset_path, person_name)
+            if os.path.isdir(person_folder):
+                for img_path in self._person_paths(person_name):
+                    self.embedding_cache.remove(img_path)
+                if delete_files:
+                    shutil.rmtree(person_folder)
+                self.embedding_cache.save()
+            return self.gallery.remove(person_name)
+
+    # --------------------------
+    # Recognition
+    # --------------------------
+    def detect(self, rgb):
+        """Face boxes (F, 4) and landmarks (F, 5, 2) for an RGB frame, or (None, None)"""
+        return detect_faces(self.mtcnn, rgb, self.config.detection_scale)
+
+    def extract(self, rgb, boxes, landmarks):
+        """Aligned (F, 3, 160, 160) face batch plus clamped integer boxes for display"""
+        faces = align_faces(rgb, boxes, landmarks, self.config.margin, self.mtcnn.image_size, self.tensor_device)
+        return faces, [clamp_box(box, rgb.shape) for box in boxes]
+
+    def embed(self, faces):
+        """(F, 512) unit embeddings of an aligned face batch, with test-time augmentation if configured"""
+        if self.batcher is not None:
+            return self.batcher(faces)
+        return self._embed_batch(faces)
+
+    def _embed_batch(self, faces):
+        embedder = self.embedder
+        embeddings = embed_faces(embedder, self.tensor_device, faces,
+                                 self.config.recognition_augmentations, average=True)
+        if embedder is not self.resnet and not self.drift.done:
+            embeddings = self._check_drift(faces, embeddings)
+        return embeddings
+
+    def _check_drift(self, faces, embeddings):
+        """Compare with the fp32 model; returns the fp32 embeddings if the drift is too large"""
+        reference = embed_faces(self.resnet, self.tensor_device, faces,
+                                self.config.recognition_augmentations, average=True)
+        self.drift.update(reference, embeddings)
+        if not self.drift.acceptable:
+            self.embedder = self.resnet
+            print(f"⚠️  Optimized embedder disabled, {self.drift.summary()}")
+            return reference
+        if self.drift.done:
+            print(f"✅ Optimized embedder verified, {self.drift.summary()}")
+        return embeddings
+
+    def match(self, embeddings):
+        return self.gallery.snapshot().match_batch(embeddings)
+
+    def _recognized(self, match, box, track_id=None):
+        name = match.name if match.distance < self.config.threshold else None
+        confidence = max(0, (1 - match.distance) * 100)
+        return RecognizedFace(name, match.distance, confidence, box, match, track_id)
+
+    def recognize(self, rgb, max_faces=None, tracker=None, timings=None):
+        """
+        Detect, embed and match every face in an RGB frame. With a
+        FaceTracker only new or stale tracks are embedded; the others reuse
+        their cached identity. Pass a dict as `timings` to get the detect
+        and embed (align + embed + match) stage times in seconds.
+        """
+        with self._active_lock:
+            self._active += 1
+        try:
+            return self._recognize(rgb, max_faces, tracker, timings)
+        finally:
+            with self._active_lock:
+                self._active -= 1
+
+    def _recognize(self, rgb, max_faces, tracker, timings):
+        started = time.perf_counter()
+        boxes, landmarks = self.detect(rgb)
+        if timings is not None:
+            timings["detect"] = time.perf_counter() - started
+            timings["embed"] = 0.0
+        if boxes is None:
+            if tracker is not None:
+                tracker.update([])
+            return []
+        if max_faces:
+            boxes, landmarks = boxes[:max_faces], landmarks[:max_faces]
+
+        started = time.perf_counter()
+        if tracker is not None:
+            results = self._recognize_tracked(rgb, boxes, landmarks, tracker)
+        else:
+            faces, coords = self.extract(rgb, boxes, landmarks)
+            results = [self._recognized(match, box)
+                       for match, box in zip(self.match(self.embed(faces)), coords)]
+        if timings is not None:
+            timings["embed"] = time.perf_counter() - started
+        return results
+
+    def _recognize_tracked(self, rgb, boxes, landmarks, tracker):
+        tracks = tracker.update(boxes)
+        snapshot = self.gallery.snapshot()
+        stale = [i for i, track in enumerate(tracks)
+                 if tracker.needs_embedding(track, self.config.threshold, snapshot.version)]
+        tracker.stats["faces"] += len(tracks)
+        tracker.stats["embedded"] += len(stale)
+
+        if stale:
+            faces, _ = self.extract(rgb, boxes[stale], landmarks[stale])
+            for i, match in zip(stale, snapshot.match_batch(self.embed(faces))):
+                tracker.add_vote(tracks[i], match, self.config.threshold, snapshot.version)
+
+        # name is the track's committed (voted) identity, distance its mean
+        return [RecognizedFace(track.name, track.distance, max(0, (1 - track.distance) * 100),
+                               clamp_box(track.box, rgb.shape), track.match, track.id)
+                for track in tracks]
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Multi-process serving mode for production_integration.py
+The parent loads the models and the gallery once, binds the port and forks
+N workers. Every worker runs the same Flask app on the shared listening
+socket (the kernel spreads connections over them), so decoding, MTCNN
+pre/post-processing and the crop loop run in parallel instead of taking
+turns on one GIL. Model weights are shared copy-on-write with the parent
+and the gallery is a memory-mapped file every worker maps
+(shared_gallery.py, FACE_SHARED_GALLERY), so enrollment through any
+worker reaches all of them. Crashed workers are restarted. Needs fork()
+(Linux/macOS); on Windows use production_integration.py.
+
+    python face_service_pool.py                      # one worker per 2 cores
+    python face_service_pool.py --workers 8 --threads 1 --port 5001
+"""
+import argparse
+import os
+import signal
+import socket
+import sys
+import time
+from werkzeug.serving import make_server
+from embedding_cache import CACHE_DIR
+
+
+def run_worker(service, listener, host, port, threads):
+    """Forked child: restart what fork() does not carry over and serve"""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # the parent handles Ctrl+C
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    service.engine.after_fork(threads)
+    server = make_server(host, port, service.app, threaded=True, fd=listener.fileno())
+    print(f"👷 Worker {os.getpid()} serving ({threads} inference threads)")
+    server.serve_forever()
+
+
+def spawn(service, listener, args):
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(service, listener, args.host, args.port, args.threads)
+        except Exception as e:
+            print(f"❌ Worker {os.getpid()} failed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+
+def main():
+    cores = os.cpu_count() or 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5001)
+    parser.add_argument("--workers", type=int, default=max(1, cores // 2))
+    parser.add_argument("--threads", type=int, default=None,
+                        help="torch / ONNX Runtime threads per worker (default: cores / workers)")
+    args = parser.parse_args()
+    args.threads = args.threads or max(1, cores // args.workers)
+    if not hasattr(os, "fork"):
+        sys.exit("❌ Worker pool needs fork(); run production_integration.py instead")
+
+    # Keep the parent single-threaded: OpenMP thread pools do not survive fork()
+    os.environ["FACE_TORCH_THREADS"] = "1"
+    os.environ.setdefault("FACE_SHARED_GALLERY", os.path.join(CACHE_DIR, "shared_gallery"))
+    import production_integration as service
+
+    print("🎯 Starting RIVA Face Recognition Service (worker pool)...")
+    if not service.load_embeddings():
+        print("❌ Failed to load face recognition model!")
+        sys.exit(1)
+    # Stop the parent's batching thread; each worker starts its own
+    if service.engine.batcher is not None:
+        service.engine.batcher.close()
+
+    listener = socket.create_server((args.host, args.port), backlog=128)
+    listener.set_inheritable(True)
+    workers = {spawn(service, listener, args) for _ in range(args.workers)}
+    print(f"✅ {args.workers} workers on http://localhost:{args.port} "
+          f"({args.threads} inference threads each, {cores} cores)")
+
+    stopping = False
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    while workers:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        workers.discard(pid)
+        if not stopping:
+            print(f"⚠️  Worker {pid} exited ({status}), restarting")
+            time.sleep(1.0)
+            workers.add(spawn(service, listener, args))
+    listener.close()
+    print("🛑 Face recognition service stopped")
+
+
+if __name__ == "__main__":
+    main()
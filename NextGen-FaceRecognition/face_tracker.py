@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Lightweight multi-face tracker for the webcam loops
+Detections are associated with existing tracks by IoU (centroid distance
+as a fallback for fast moves), optionally through a constant-velocity
+Kalman filter. Each track caches its last identity, so a person standing
+in front of the kiosk is re-embedded only every `reembed_interval`
+seconds - or sooner when the match was uncertain, the face moved a lot or
+the gallery changed - instead of on every frame.
+
+An identity is only committed to a track once `vote_min` of its last
+`vote_window` embeddings agree on the same person with an average
+distance under the threshold, so one noisy frame cannot trigger a
+greeting.
+"""
+import itertools
+import time
+from collections import Counter, deque
+import numpy as np
+
+
+def box_iou(boxes_a, boxes_b):
+    """Pairwise IoU of (A, 4) and (B, 4) x1, y1, x2, y2 boxes -> (A, B)"""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(1, -1, 4)
+    w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = w * h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-9)
+
+
+class BoxKalman:
+    """
+    Constant-velocity Kalman filter on (cx, cy, w, h); one step per
+    processed frame. Smooths jittery MTCNN boxes and predicts where a
+    moving face will be on the next frame.
+    """
+
+    def __init__(self, box, process_noise=1.0, measurement_noise=10.0):
+        x1, y1, x2, y2 = box
+        # state: cx, cy, w, h, vx, vy
+        self.x = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1, 0.0, 0.0])
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 100.0, 100.0])
+        self.F = np.eye(6)
+        self.F[0, 4] = self.F[1, 5] = 1.0
+        self.H = np.eye(4, 6)
+        self.Q = np.eye(6) * process_noise
+        self.R = np.eye(4) * measurement_noise
+
+    @property
+    def box(self):
+        cx, cy, w, h = self.x[:4]
+        return np.array([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2])
+
+    def predict(self):
+        self.x = self.F @ self.x
+        self.P = self.F @ self.P @ self.F.T + self.Q
+        return self.box
+
+    def update(self, box):
+        x1, y1, x2, y2 = box
+        z = np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1])
+        S = self.H @ self.P @ self.H.T + self.R
+        K = self.P @ self.H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - self.H @ self.x)
+        self.P = (np.eye(6) - K @ self.H) @ self.P
+        return self.box
+
+
+class Track:
+    """One face followed across frames, with its cached identity"""
+
+    def __init__(self, track_id, box, kalman=False, vote_window=1):
+        self.id = track_id
+        self.box = np.asarray(box, dtype=np.float64)
+        self.filter = BoxKalman(box) if kalman else None
+        self.missed = 0
+        self.hits = 0
+        # (best match name, distance) of the last vote_window embeddings
+        self.votes = deque(maxlen=vote_window)
+        # Committed identity (None until the vote passes) and its mean distance
+        self.name = None
+        self.distance = float("inf")
+        self.match = None              # Match of the last embedding
+        self.single_frame_names = set()  # names any single embedding accepted
+        self.committed_names = set()     # names the vote ever committed
+        self.embedded_at = None        # time.monotonic() of the last embedding
+        self.embedded_box = None
+        self.gallery_version = None
+
+    @property
+    def vetoed_names(self):
+        """Names a first-frame rule would have greeted but the vote never committed"""
+        return self.single_frame_names - self.committed_names
+
+    def predicted_box(self):
+        return self.filter.predict() if self.filter is not None else self.box
+
+    def observe(self, box):
+        self.box = self.filter.update(box) if self.filter is not None else np.asarray(box, dtype=np.float64)
+        self.missed = 0
+        self.hits += 1
+
+
+class FaceTracker:
+    """
+    Per-stream track state for FaceEngine.recognize(rgb, tracker=...).
+    A matched track reuses its identity unless it is due for re-embedding:
+      - reembed_interval seconds since the last embedding (confident match)
+      - uncertain_interval seconds when the last distance was within
+        `uncertain_margin` of the threshold, or no one was matched
+      - the face moved/resized so its box overlaps the embedded one by
+        less than `reembed_iou`
+      - the gallery changed (enrollment or reload)
+    Until its vote window is full an unconfirmed track is embedded on every
+    frame. vote_window=1, vote_min=1 commits on the first frame.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_center_shift=0.5, max_missed=5,
+                 reembed_interval=2.0, uncertain_interval=0.5, uncertain_margin=0.1,
+                 reembed_iou=0.5, kalman=False, vote_window=5, vote_min=3):
+        if not 1 <= vote_min <= vote_window:
+            raise ValueError("need 1 <= vote_min <= vote_window")
+        self.iou_threshold = iou_threshold
+        self.max_center_shift = max_center_shift
+        self.max_missed = max_missed
+        self.reembed_interval = reembed_interval
+        self.uncertain_interval = uncertain_interval
+        self.uncertain_margin = uncertain_margin
+        self.reembed_iou = reembed_iou
+        self.kalman = kalman
+        self.vote_window = vote_window
+        self.vote_min = vote_min
+        self.tracks = []
+        self.stats = Counter()
+        self._ids = itertools.count(1)
+
+    def _associate(self, boxes):
+        """Greedy one-to-one detection -> track assignment; returns {detection: track}"""
+        assigned = {}
+        if not self.tracks or not len(boxes):
+            return assigned
+        predicted = np.array([track.predicted_box() for track in self.tracks])
+        iou = box_iou(boxes, predicted)
+        free_tracks = set(range(len(self.tracks)))
+
+        # Best IoU pairs first
+        for flat in np.argsort(-iou, axis=None):
+            d, t = np.unravel_index(flat, iou.shape)
+            if iou[d, t] < self.iou_threshold:
+                break
+            if d not in assigned and t in free_tracks:
+                assigned[d] = self.tracks[t]
+                free_tracks.discard(t)
+
+        # Fast moves: nearest centre within max_center_shift box widths
+        for d in range(len(boxes)):
+            if d in assigned or not free_tracks:
+                continue
+            centre = (boxes[d, :2] + boxes[d, 2:]) / 2
+            width = boxes[d, 2] - boxes[d, 0]
+            candidates = sorted(free_tracks, key=lambda t: np.linalg.norm(
+                (predicted[t, :2] + predicted[t, 2:]) / 2 - centre))
+            t = candidates[0]
+            shift = np.linalg.norm((predicted[t, :2] + predicted[t, 2:]) / 2 - centre)
+            if shift <= self.max_center_shift * width:
+                assigned[d] = self.tracks[t]
+                free_tracks.discard(t)
+        return assigned
+
+    def update(self, boxes):
+        """Associate this frame's (F, 4) detections; returns one Track per detection"""
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        assigned = self._associate(boxes)
+
+        tracks = []
+        for d, box in enumerate(boxes):
+            track = assigned.get(d)
+            if track is None:
+                track = Track(next(self._ids), box, self.kalman, self.vote_window)
+                self.tracks.append(track)
+                self.stats["tracks"] += 1
+            track.observe(box)
+            tracks.append(track)
+
+        seen = set(map(id, tracks))
+        for track in self.tracks:
+            if id(track) not in seen:
+                track.missed += 1
+        for track in self.tracks:
+            if track.missed > self.max_missed:
+                self._count_vetoed(track)
+        self.tracks = [track for track in self.tracks if track.missed <= self.max_missed]
+        return tracks
+
+    def _count_vetoed(self, track):
+        # Once per track, when it closes
+        self.stats["vetoed"] += len(track.vetoed_names)
+
+    def needs_embedding(self, track, threshold, gallery_version, now=None):
+        if track.embedded_at is None or track.gallery_version != gallery_version:
+            return True
+        if track.name is None and len(track.votes) < self.vote_window:
+            return True
+        now = time.monotonic() if now is None else now
+        uncertain = track.name is None or track.distance > threshold - self.uncertain_margin
+        interval = self.uncertain_interval if uncertain else self.reembed_interval
+        if now - track.embedded_at >= interval:
+            return True
+        return box_iou(track.box, track.embedded_box)[0, 0] < self.reembed_iou
+
+    def add_vote(self, track, match, threshold, gallery_version, now=None):
+        """Record one embedding's match and (re)decide the track's committed identity"""
+        track.votes.append((match.name, match.distance))
+        track.match = match
+        track.embedded_at = time.monotonic() if now is None else now
+        track.embedded_box = track.box.copy()
+        track.gallery_version = gallery_version
+        if match.name is not None and match.distance < threshold:
+            track.single_frame_names.add(match.name)
+
+        previous = track.name
+        track.name, track.distance = None, match.distance
+        counts = Counter(name for name, _ in track.votes if name is not None)
+        if counts:
+            name, count = counts.most_common(1)[0]
+            distance = float(np.mean([d for n, d in track.votes if n == name]))
+            if count >= self.vote_min and distance < threshold:
+                track.name, track.distance = name, distance
+        if track.name is not None and track.name != previous:
+            self.stats["committed"] += 1
+            track.committed_names.add(track.name)
+
+    def reset(self):
+        for track in self.tracks:
+            self._count_vetoed(track)
+        self.tracks = []
+
+    def vetoed(self):
+        """Single-frame identities the vote rejected, including live tracks"""
+        return self.stats["vetoed"] + sum(len(track.vetoed_names) for track in self.tracks)
+
+    def summary(self):
+        faces = self.stats["faces"]
+        saved = faces - self.stats["embedded"]
+        rate = saved / faces * 100 if faces else 0.0
+        return (f"{faces} face observations, {self.stats['embedded']} embedded, "
+                f"{saved} reused from tracks ({rate:.0f}% saved), {self.stats['tracks']} tracks, "
+                f"{self.stats['committed']} identities committed by {self.vote_min}-of-{self.vote_window} vote, "
+                f"{self.vetoed()} single-frame identities vetoed (greetings not sent)")
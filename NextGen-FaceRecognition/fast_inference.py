@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Optimized CPU inference for the InceptionResnetV1 embedder
+optimize_embedder() returns a faster copy of the fp32 model and leaves the
+original untouched, so the engine keeps it as the reference for enrollment
+and for drift checks. Available optimizations (combine freely):
+
+    int8           dynamic int8 quantization of the Linear layers
+    channels_last  NHWC weights and inputs (faster oneDNN convolutions)
+    script         TorchScript trace + freeze (folds batch norms, no Python overhead)
+    compile        torch.compile (slow first call, needs a C++ compiler)
+
+An optimization that fails on this machine is skipped with a warning.
+DriftMonitor compares the optimized embeddings of the first live faces
+with the fp32 ones, in the same L2 units as the recognition threshold.
+"""
+import copy
+import numpy as np
+import torch
+
+OPTIMIZATIONS = ("int8", "channels_last", "script", "compile")
+
+
+class ChannelsLast(torch.nn.Module):
+    """Feeds a channels-last model channels-last inputs"""
+
+    def __init__(self, model):
+        super().__init__()
+        self.model = model.to(memory_format=torch.channels_last)
+        self.train(model.training)
+
+    def forward(self, x):
+        return self.model(x.contiguous(memory_format=torch.channels_last))
+
+
+def parse_optimizations(value):
+    """'int8,channels_last' -> ('int8', 'channels_last'); raises on unknown names"""
+    if isinstance(value, str):
+        value = value.split(",")
+    names = tuple(name.strip() for name in value if name.strip())
+    unknown = [name for name in names if name not in OPTIMIZATIONS]
+    if unknown:
+        raise ValueError(f"Unknown embedder optimizations: {unknown} (choose from {OPTIMIZATIONS})")
+    return names
+
+
+def optimize_embedder(model, optimizations, example):
+    """
+    Optimized copy of an eval-mode CPU model. `example` is a representative
+    input batch used to trace and warm up the model. Returns (model, applied
+    optimizations).
+    """
+    optimizations = parse_optimizations(optimizations)
+    optimized = copy.deepcopy(model).eval()
+    applied = []
+    steps = [
+        ("int8", lambda m: torch.ao.quantization.quantize_dynamic(m, {torch.nn.Linear}, dtype=torch.qint8)),
+        ("channels_last", ChannelsLast),
+        ("script", lambda m: torch.jit.freeze(torch.jit.trace(m, example))),
+        ("compile", torch.compile),
+    ]
+    # Fixed order: quantize before tracing, trace before compiling
+    for name, step in steps:
+        if name not in optimizations:
+            continue
+        try:
+            with torch.inference_mode():
+                candidate = step(optimized)
+                candidate(example)  # compile errors only show up on the first call
+        except Exception as e:
+            print(f"⚠️  Embedder optimization '{name}' unavailable, skipping: {e}")
+            continue
+        optimized = candidate
+        applied.append(name)
+    return optimized, tuple(applied)
+
+
+class DriftMonitor:
+    """
+    Collects the L2 distance between reference and optimized unit embeddings
+    of the same faces until `samples` faces were compared. `acceptable` is
+    False once the worst drift exceeds `limit`.
+    """
+
+    def __init__(self, samples=64, limit=0.05):
+        self.samples = samples
+        self.limit = limit
+        self.distances = []
+
+    @property
+    def done(self):
+        return len(self.distances) >= self.samples
+
+    @property
+    def acceptable(self):
+        return not self.distances or max(self.distances) <= self.limit
+
+    def update(self, reference, optimized):
+        self.distances.extend(np.linalg.norm(reference - optimized, axis=1).tolist())
+
+    def summary(self):
+        if not self.distances:
+            return "not measured yet"
+        distances = np.array(self.distances)
+        return (f"L2 drift vs fp32 over {len(distances)} faces: mean {distances.mean():.4f}, "
+                f"max {distances.max():.4f} (limit {self.limit})")
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Adaptive recognition scheduling for the webcam pipeline
+Replaces fixed "every Nth frame" skipping. The scheduler measures how long
+detection and embedding take (moving averages) and picks the pause before
+the next recognition pass:
+  - never less than what keeps inference within `cpu_budget` of a core
+  - as short as that allows while the scene is active (new faces, tracks
+    still voting, motion reported by the caller)
+  - backing off geometrically when the same people stand still, up to
+    `max_latency` so changes are still noticed in time
+  - backing off further, up to `idle_interval`, while nobody is in view
+"""
+import time
+
+# First step when backing off from back-to-back recognition (seconds)
+BACKOFF_START = 0.05
+
+
+class AdaptiveScheduler:
+    def __init__(self, cpu_budget=0.7, max_latency=0.5, idle_interval=1.0,
+                 backoff=1.5, smoothing=0.2):
+        if not 0 < cpu_budget <= 1:
+            raise ValueError("cpu_budget must be in (0, 1]")
+        self.cpu_budget = cpu_budget
+        self.max_latency = max_latency
+        self.idle_interval = idle_interval
+        self.backoff = backoff
+        self.smoothing = smoothing
+        self.stage_seconds = {}   # moving average per stage
+        self.interval = 0.0       # current pause between recognition passes
+        self.state = "active"
+        self._next_due = 0.0
+        self._last_run = 0.0
+        self._known_tracks = 0
+        self._motion = False
+
+    @property
+    def processing(self):
+        return sum(self.stage_seconds.values())
+
+    @property
+    def min_interval(self):
+        """Pause that keeps inference at cpu_budget of one core"""
+        return self.processing * (1.0 / self.cpu_budget - 1.0)
+
+    def delay(self, now=None):
+        """Seconds to wait before the next recognition pass"""
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._next_due - now)
+
+    def notify_motion(self):
+        """Something changed in the frame (e.g. a motion detector fired): run again soon"""
+        self._motion = True
+        self._next_due = min(self._next_due, self._last_run + self.min_interval)
+
+    def skip(self, now=None):
+        """A pass was skipped (e.g. no motion): check again after the current interval"""
+        now = time.monotonic() if now is None else now
+        self._next_due = now + self.interval
+
+    def update(self, timings, tracker=None, faces=(), now=None):
+        """Record one recognition pass and schedule the next one"""
+        now = time.monotonic() if now is None else now
+        for stage, seconds in timings.items():
+            previous = self.stage_seconds.get(stage, seconds)
+            self.stage_seconds[stage] = previous + self.smoothing * (seconds - previous)
+
+        new_tracks = voting = False
+        if tracker is not None:
+            new_tracks = tracker.stats["tracks"] > self._known_tracks
+            self._known_tracks = tracker.stats["tracks"]
+            voting = any(track.name is None and len(track.votes) < tracker.vote_window
+                         for track in tracker.tracks if not track.missed)
+        present = bool(faces)
+
+        if new_tracks or voting or self._motion:
+            self.state = "active"
+            self.interval = self.min_interval
+        elif present:
+            self.state = "static"
+            ceiling = max(self.min_interval, self.max_latency - self.processing)
+            self.interval = min(ceiling, max(self.interval, self.min_interval, BACKOFF_START) * self.backoff)
+        else:
+            self.state = "idle"
+            self.interval = min(max(self.idle_interval, self.min_interval),
+                                max(self.interval, self.min_interval, BACKOFF_START) * self.backoff)
+        self._motion = False
+        self._last_run = now
+        self._next_due = now + self.interval
+
+    def summary(self):
+        stages = ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in self.stage_seconds.items())
+        return f"{self.state}, every {self.interval * 1000:.0f}ms [{stages}]"
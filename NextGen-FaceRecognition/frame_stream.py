@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Latest-frame recognition for one streaming client
+A client pushes encoded frames as fast as it likes; a worker thread only
+ever recognizes the newest one. A frame that arrives while the previous
+one is still waiting replaces it (and is counted as dropped), so a slow
+CPU skips frames instead of queueing them. Frames are decoded by the
+worker, so dropped frames are never decoded either. Each stream has its
+own FaceTracker, so results carry stable track IDs.
+"""
+import threading
+import time
+from collections import Counter
+from face_tracker import FaceTracker
+from video_pipeline import LatestQueue
+
+
+class FrameStream:
+    """
+    push(data) from the receiving thread; send(frame_id, faces, stats) is
+    called on the worker thread with the RecognizedFace list of every
+    processed frame. decode(data) turns a pushed payload into an RGB
+    image (None = invalid). Invalid frames and frames whose recognition
+    raised are answered too, with no faces and stats {"error": ...}, so a
+    client counting frames in flight never waits for a missing reply.
+    """
+
+    def __init__(self, engine, decode, send, tracker=None):
+        self.engine = engine
+        self.decode = decode
+        self.send = send
+        self.tracker = tracker or FaceTracker()
+        self.queue = LatestQueue()
+        self.stats = Counter()
+        self._frame_id = 0
+        self._closed = threading.Event()
+        self._worker = threading.Thread(target=self._run, name="frame-stream", daemon=True)
+        self._worker.start()
+
+    def push(self, data):
+        """Offer a new frame; replaces one that has not been picked up yet"""
+        self._frame_id += 1
+        self.stats["received"] += 1
+        self.queue.put((self._frame_id, data, time.perf_counter()))
+
+    def _run(self):
+        try:
+            while not self._closed.is_set():
+                item = self.queue.get(timeout=0.5)
+                if item is None:
+                    continue
+                frame_id, data, received = item
+                try:
+                    faces, stats = self._process(data, received)
+                except Exception as e:
+                    self.stats["failed"] += 1
+                    faces, stats = [], {"error": f"Recognition failed: {e}"}
+                try:
+                    self.send(frame_id, faces, stats)
+                except Exception:
+                    # Client went away; the receiving side closes the stream
+                    break
+        finally:
+            # Also when the worker dies, so the receiving side stops reading
+            self._closed.set()
+
+    def _process(self, data, received):
+        """(faces, stats) for one frame; an undecodable frame gets an error reply"""
+        img = self.decode(data)
+        if img is None:
+            self.stats["invalid"] += 1
+            return [], {"error": "Invalid image data"}
+        timings = {}
+        faces = self.engine.recognize(img, tracker=self.tracker, timings=timings)
+        self.stats["processed"] += 1
+        return faces, {
+            "dropped": self.queue.dropped,
+            "latency_ms": round((time.perf_counter() - received) * 1000, 1),
+            "detect_ms": round(timings["detect"] * 1000, 1),
+            "embed_ms": round(timings["embed"] * 1000, 1),
+        }
+
+    @property
+    def closed(self):
+        return self._closed.is_set()
+
+    def close(self):
+        self._closed.set()
+        self.queue.close()
+        self._worker.join(timeout=5)
+
+    def summary(self):
+        return (f"{self.stats['received']} frames received, {self.stats['processed']} processed, "
+                f"{self.queue.dropped} dropped, {self.stats['invalid']} invalid, {self.stats['failed']} failed")
@@ -0,0 +1,249 @@
+#!/usr/bin/env python3
+"""
+Face gallery: one contiguous float32 (N, 512) embedding matrix with an
+aligned label array. Rows are appended into a preallocated buffer that
+grows in amortized chunks, and matching goes through a pluggable
+nearest-neighbour index (see ann_index.py) over that buffer instead of
+re-stacking a Python list per lookup. The index also allocates the
+buffer, so a quantized index can keep the float32 rows out of memory.
+"""
+import itertools
+import threading
+from collections import namedtuple
+import numpy as np
+from ann_index import ExactIndex
+
+EMBEDDING_DIM = 512
+INITIAL_CAPACITY = 64
+
+# (matrix buffer, label buffer, row count, index, version) - swapped as one
+# reference so a reader never sees rows that are only half written
+_State = namedtuple("_State", ["matrix", "labels", "count", "index", "version"])
+# Every state gets a new version, unique across galleries, so readers can
+# tell whether cached match results are still current
+_versions = itertools.count(1)
+
+# Best stored row for one query face, and the best row of any other person
+Match = namedtuple("Match", ["name", "distance", "runner_up", "runner_up_distance"])
+NO_MATCH = Match(None, float("inf"), None, float("inf"))
+# Rows fetched per face to find the runner-up; if all of them belong to the
+# best person, the runner-up comes from an exact scan of the other rows
+RUNNER_UP_CANDIDATES = 16
+
+
+def compute_prototypes(embeddings, k=1, iters=10):
+    """
+    Collapse one person's (n, 512) unit-norm embeddings to at most k
+    unit-norm centroids (spherical k-means). Returns (centroids, spread)
+    where spread is the mean L2 distance of the images to their centroid.
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+    k = max(1, min(k, len(embeddings)))
+    # Deterministic init: images spread evenly through the enrollment order
+    centroids = embeddings[np.linspace(0, len(embeddings) - 1, k).astype(int)].copy()
+    for _ in range(iters if k > 1 else 1):
+        assignment = np.argmax(embeddings @ centroids.T, axis=1)
+        for c in range(k):
+            members = embeddings[assignment == c]
+            if len(members):
+                centroids[c] = members.sum(axis=0)
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+
+    similarities = np.max(embeddings @ centroids.T, axis=1)
+    spread = float(np.mean(np.sqrt(np.maximum(2.0 - 2.0 * similarities, 0.0))))
+    return centroids, spread
+
+
+class GallerySnapshot:
+    """Read-only view of the gallery at one point in time"""
+
+    def __init__(self, state):
+        self.encodings = state.matrix[:state.count]
+        self.labels = state.labels[:state.count]
+        self.index = state.index
+        self.version = state.version
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def names(self):
+        return tuple(self.labels)
+
+    def distances(self, embedding):
+        """
+        L2 distances from a unit-norm embedding to every stored embedding.
+        For unit vectors ||a - b||^2 = 2 - 2 a.b, so one matvec is enough.
+        """
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        similarities = self.encodings @ embedding
+        return np.sqrt(np.maximum(2.0 - 2.0 * similarities, 0.0))
+
+    def match(self, embedding):
+        """Return (name, distance) of the closest stored embedding"""
+        best = self.match_batch(embedding)[0]
+        return best.name, best.distance
+
+    def match_batch(self, embeddings):
+        """
+        Match every face of a frame at once. With the exact index this is
+        one (F, 512) x (512, N) GEMM plus argpartition for the top rows.
+        Returns a list of F Match; runner_up is the closest other person.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.encodings.shape[1])
+        if not len(self):
+            return [NO_MATCH] * len(embeddings)
+
+        k = min(RUNNER_UP_CANDIDATES, len(self))
+        top, top_sims = self.index.search(self.encodings, embeddings, k)
+        top_dists = np.sqrt(np.maximum(2.0 - 2.0 * top_sims, 0.0))
+
+        matches = []
+        for embedding, idx, dists in zip(embeddings, top, top_dists):
+            name = self.labels[idx[0]]
+            others = [j for j, i in enumerate(idx) if i >= 0 and self.labels[i] != name]
+            if others:
+                runner_up, runner_up_distance = self.labels[idx[others[0]]], float(dists[others[0]])
+            else:
+                runner_up, runner_up_distance = self._runner_up(embedding, name)
+            matches.append(Match(name, float(dists[0]), runner_up, runner_up_distance))
+        return matches
+
+    def _runner_up(self, embedding, name):
+        """(label, distance) of the closest row not labelled `name`"""
+        others = self.labels != name
+        if not others.any():
+            return None, float("inf")
+        similarities = self.encodings[others] @ embedding
+        best = int(np.argmax(similarities))
+        return self.labels[others][best], float(np.sqrt(max(2.0 - 2.0 * similarities[best], 0.0)))
+
+
+class FaceGallery:
+    """
+    Append-only embedding store. Writers are serialized with a lock;
+    readers call snapshot() (or match()) and never block.
+    `index` is an ann_index backend (exact brute force by default).
+    """
+
+    def __init__(self, dim=EMBEDDING_DIM, capacity=INITIAL_CAPACITY, index=None):
+        self.dim = dim
+        self._index = index or ExactIndex()
+        self._lock = threading.Lock()
+        self._state = self._allocate(capacity)
+        # name -> spread of that person's images around their prototypes
+        # (only filled in prototype mode)
+        self.spreads = {}
+
+    def _allocate(self, capacity):
+        return _State(
+            self._index.allocate(capacity, self.dim),
+            np.empty(capacity, dtype=object),
+            0,
+            self._index.build(np.zeros((0, self.dim), np.float32)),
+            next(_versions),
+        )
+
+    def __len__(self):
+        return self._state.count
+
+    @property
+    def names(self):
+        return self.snapshot().names
+
+    @property
+    def version(self):
+        return self._state.version
+
+    def snapshot(self):
+        return GallerySnapshot(self._state)
+
+    def match(self, embedding):
+        return self.snapshot().match(embedding)
+
+    def add(self, embeddings, names):
+        """
+        Append (k, 512) embeddings. `names` is one label for all rows or a
+        sequence of k labels. Embeddings are expected to be L2-normalised.
+        """
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        if isinstance(names, str):
+            names = [names] * len(embeddings)
+        if len(names) != len(embeddings):
+            raise ValueError("names and embeddings must have the same length")
+
+        with self._lock:
+            matrix, labels, count, index, _ = self._state
+            new_count = count + len(embeddings)
+            if new_count > len(matrix):
+                # Grow geometrically so enrollment stays amortized O(1) per row
+                capacity = max(new_count, 2 * len(matrix), INITIAL_CAPACITY)
+                grown = self._allocate(capacity)
+                grown.matrix[:count] = matrix[:count]
+                grown.labels[:count] = labels[:count]
+                index.release(matrix)
+                matrix, labels = grown.matrix, grown.labels
+
+            # Rows past `count` are invisible to existing snapshots
+            matrix[count:new_count] = embeddings
+            labels[count:new_count] = names
+            index = index.extended(matrix, count, new_count)
+            self._state = _State(matrix, labels, new_count, index, next(_versions))
+            index.release(matrix)
+
+    def remove(self, name):
+        """Drop every row labelled `name`; returns the number removed"""
+        with self._lock:
+            matrix, labels, count, old_index, _ = self._state
+            keep = labels[:count] != name
+            removed = int(count - keep.sum())
+            if removed:
+                # Compact into a fresh buffer; old snapshots keep the old one
+                fresh = self._allocate(len(matrix))
+                kept = count - removed
+                fresh.matrix[:kept] = matrix[:count][keep]
+                fresh.labels[:kept] = labels[:count][keep]
+                index = self._index.build(fresh.matrix[:kept])
+                self._state = _State(fresh.matrix, fresh.labels, kept, index, next(_versions))
+                old_index.release(matrix)
+                index.release(fresh.matrix)
+            self.spreads.pop(name, None)
+            return removed
+
+    def replace(self, name, embeddings, spread=None):
+        """Atomically swap all rows of `name` for new embeddings"""
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(-1, self.dim)
+        with self._lock:
+            matrix, labels, count, old_index, _ = self._state
+            keep = labels[:count] != name
+            kept = int(keep.sum())
+            new_count = kept + len(embeddings)
+            fresh = self._allocate(max(len(matrix), new_count))
+            fresh.matrix[:kept] = matrix[:count][keep]
+            fresh.labels[:kept] = labels[:count][keep]
+            fresh.matrix[kept:new_count] = embeddings
+            fresh.labels[kept:new_count] = [name] * len(embeddings)
+            index = self._index.build(fresh.matrix[:new_count])
+            self._state = _State(fresh.matrix, fresh.labels, new_count, index, next(_versions))
+            old_index.release(matrix)
+            index.release(fresh.matrix)
+            if spread is not None:
+                self.spreads[name] = spread
+
+    def to_prototypes(self, k=1):
+        """
+        New gallery with each identity collapsed to at most k centroids, so
+        size and match cost scale with people rather than photos per person
+        """
+        snapshot = self.snapshot()
+        prototypes = FaceGallery(self.dim, index=self._index)
+        for name in dict.fromkeys(snapshot.labels):
+            centroids, spread = compute_prototypes(snapshot.encodings[snapshot.labels == name], k)
+            prototypes.add(centroids, name)
+            prototypes.spreads[name] = spread
+        return prototypes
+
+    def clear(self):
+        with self._lock:
+            self._state = self._allocate(len(self._state.matrix))
+            self.spreads = {}
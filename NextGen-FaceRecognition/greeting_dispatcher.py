@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Non-blocking greeting dispatch to the RIVA backend
+Greeting requests go into a bounded queue and are posted by a background
+worker over a pooled keep-alive requests.Session. A greeting is not
+idempotent (the backend runs the LLM and TTS for every POST), so only
+attempts that never reached the backend are retried, with exponential
+backoff; read timeouts and 5xx replies are final. A second request for someone whose greeting is still
+pending is dropped, so the video loop never waits on the backend.
+"""
+import queue
+import threading
+import time
+from collections import Counter
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+RIVA_GREET_URL = "http://localhost:5000/api/greet"
+# on_done error for connection failures (backend not started)
+BACKEND_UNREACHABLE = "RIVA backend not reachable"
+
+
+def never_sent(error):
+    """True when the connection could not be opened, so the backend never saw the request"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(error, requests.exceptions.ConnectionError) and isinstance(reason, NewConnectionError)
+
+
+def print_reply(person_name, data, error):
+    """Default send_greeting() report: the greeting text, or why it failed"""
+    if data is not None:
+        print(f"✅ RIVA greeted: {person_name}")
+        print(f"🎤 Greeting: {data.get('greeting', '')}")
+    elif error == BACKEND_UNREACHABLE:
+        print("❌ RIVA Backend not running! Start: cd ../backend && node server.js")
+    else:
+        print(f"❌ Failed to send greeting: {error}")
+
+
+class GreetingDispatcher:
+    """
+    submit(key, payload, on_done) returns immediately; on_done(data, error)
+    is called on the worker thread with the backend's JSON reply on
+    success, or (None, reason) once all retries have failed.
+    """
+
+    def __init__(self, url=RIVA_GREET_URL, max_pending=8, retries=2, backoff=0.5,
+                 timeout=10.0, workers=1):
+        self.url = url
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.stats = Counter()
+        self._inflight = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"greeting-{i}", daemon=True)
+            for i in range(workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, key, payload, on_done=None):
+        """Queue a request; False if one for `key` is already pending or the queue is full"""
+        with self._lock:
+            if key in self._inflight:
+                self.stats["deduplicated"] += 1
+                return False
+            try:
+                self.queue.put_nowait((key, payload, on_done))
+            except queue.Full:
+                self.stats["dropped"] += 1
+                return False
+            self._inflight.add(key)
+        self.stats["queued"] += 1
+        return True
+
+    def send_greeting(self, person_name, on_done=None, on_reply=print_reply):
+        """
+        Queue a greeting for `person_name`; False if one is already pending
+        or the queue is full. On the worker thread on_reply(person_name,
+        data, error) reports the backend reply, then on_done(success) runs.
+        """
+        def handle_reply(data, error):
+            if on_reply is not None:
+                on_reply(person_name, data, error)
+            if on_done is not None:
+                on_done(data is not None)
+
+        return self.submit(person_name, {"dignitary": person_name}, handle_reply)
+
+    def pending(self, key):
+        with self._lock:
+            return key in self._inflight
+
+    def _post(self, payload):
+        """(reply JSON, None) or (None, reason); retries only requests that were never sent"""
+        error = None
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self.stats["retries"] += 1
+                # Sleeps, but wakes up early on close()
+                if self._stop.wait(self.backoff * 2 ** (attempt - 1)):
+                    break
+            try:
+                response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            except requests.exceptions.RequestException as e:
+                if never_sent(e):
+                    error = BACKEND_UNREACHABLE
+                    continue
+                # The backend may already be greeting: posting again could greet twice
+                return None, str(e)
+
+            if response.status_code != 200:
+                return None, f"HTTP {response.status_code}"
+            try:
+                data = response.json()
+            except ValueError:
+                return None, "invalid JSON reply"
+            if not data.get('success'):
+                return None, data.get('error', 'backend reported failure')
+            return data, None
+        return None, error
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                key, payload, on_done = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            data, error = self._post(payload)
+            self.stats["sent" if data is not None else "failed"] += 1
+            with self._lock:
+                self._inflight.discard(key)
+            if on_done is not None:
+                try:
+                    on_done(data, error)
+                except Exception as e:
+                    print(f"❌ Greeting callback failed: {e}")
+
+    def close(self, timeout=2.0):
+        """Give pending greetings up to `timeout` seconds, then stop the workers"""
+        deadline = time.monotonic() + timeout
+        while self._inflight and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+        for worker in self._workers:
+            worker.join(timeout=1.0)
+        self.session.close()
+
+    def summary(self):
+        return ", ".join(f"{name}: {count}" for name, count in sorted(self.stats.items())) or "no greetings"
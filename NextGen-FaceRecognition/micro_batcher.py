@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Request coalescing for the embedder
+With threaded Flask every request used to run InceptionResnetV1 on its own
+few crops, from its own thread, on the same model. MicroBatcher collects
+the face crops of concurrent callers for up to `max_wait` seconds (or
+until `max_batch` crops are waiting), runs one batched forward pass on a
+single worker thread and hands every caller its own rows back.
+
+The wait only happens while other requests are in flight (`expected`), so
+a single client pays no extra latency.
+"""
+import queue
+import threading
+import time
+from collections import Counter
+import numpy as np
+from alignment import concat_faces
+
+
+class _Request:
+    __slots__ = ("items", "result", "error", "done")
+
+    def __init__(self, items):
+        self.items = items
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class MicroBatcher:
+    """
+    batcher(items) -> fn(items), where fn maps an (N, ...) tensor or array to N
+    result rows. Blocks the caller until its batch has run; exceptions
+    raised by fn are re-raised in every caller of that batch.
+    expected() returns how many callers may still submit (e.g. requests
+    currently being processed); None always waits the full max_wait.
+    """
+
+    def __init__(self, fn, max_batch=32, max_wait=0.003, expected=None):
+        self.fn = fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.expected = expected
+        self.stats = Counter()
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="micro-batcher", daemon=True)
+        self._worker.start()
+
+    def __call__(self, items):
+        if not len(items):
+            return self.fn(items)
+        request = _Request(items)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise request.error
+        return request.result
+
+    def _collect(self, first):
+        """first plus whatever arrives within max_wait, up to max_batch items"""
+        pending, count = [first], len(first.items)
+        deadline = time.perf_counter() + self.max_wait
+        while count < self.max_batch:
+            try:
+                request = self._queue.get_nowait()
+            except queue.Empty:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0 or (self.expected is not None and self.expected() <= len(pending)):
+                    break
+                try:
+                    request = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+            if request is None:
+                self._queue.put(None)  # stop after this batch
+                break
+            pending.append(request)
+            count += len(request.items)
+        return pending
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                break
+            pending = self._collect(first)
+            try:
+                results = self.fn(concat_faces([request.items for request in pending]))
+                splits = np.cumsum([len(request.items) for request in pending])[:-1]
+                for request, result in zip(pending, np.split(results, splits)):
+                    request.result = result
+            except Exception as e:
+                for request in pending:
+                    request.error = e
+            self.stats["batches"] += 1
+            self.stats["requests"] += len(pending)
+            self.stats["items"] += sum(len(request.items) for request in pending)
+            for request in pending:
+                request.done.set()
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join(timeout=5)
+
+    def summary(self):
+        batches = self.stats["batches"]
+        if not batches:
+            return "no batches"
+        return (f"{self.stats['requests']} requests in {batches} batches "
+                f"({self.stats['requests'] / batches:.1f} requests, "
+                f"{self.stats['items'] / batches:.1f} faces per forward pass)")
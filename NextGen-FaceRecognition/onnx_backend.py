@@ -0,0 +1,303 @@
+#!/usr/bin/env python3
+"""
+ONNX Runtime backend for the detector and the embedder
+export_onnx.py writes InceptionResnetV1 and MTCNN's P/R/O-Nets to ONNX
+files. With EngineConfig.runtime = "onnx" the engine runs them through
+ONNX Runtime on CPU without torch: OnnxDetector is a numpy port of
+facenet_pytorch's MTCNN.detect (image pyramid, box regression, NMS) and
+faces are aligned, augmented and embedded as numpy arrays, so neither
+torch nor facenet_pytorch is imported. Area resampling uses integral
+images and reproduces torch's "area" interpolation exactly.
+"""
+import os
+import numpy as np
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+OPSET = 17
+EMBEDDER = "embedder"
+DETECTOR_NETS = ("pnet", "rnet", "onet")
+# name -> (example input shape, output names, dynamic input axes); P-Net
+# runs on every pyramid scale, so its height and width vary too
+NETS = {
+    EMBEDDER: ((2, 3, 160, 160), ["embeddings"], {0: "batch"}),
+    "pnet": ((1, 3, 120, 160), ["offsets", "probs"], {0: "batch", 2: "height", 3: "width"}),
+    "rnet": ((2, 3, 24, 24), ["offsets", "probs"], {0: "batch"}),
+    "onet": ((2, 3, 48, 48), ["offsets", "landmarks", "probs"], {0: "batch"}),
+}
+# facenet_pytorch's MTCNN constants
+PYRAMID_FACTOR = 0.709
+STAGE_BATCH = 512  # R/O-Net crops per run, as in fixed_batch_process
+
+
+def model_path(directory, name):
+    return os.path.join(directory, f"{name}.onnx")
+
+
+class OnnxSession:
+    """
+    An exported network behind an ONNX Runtime CPU session: float32 numpy
+    batch in, numpy output(s) out. `threads` is the intra-op thread count
+    (0 = ONNX Runtime's default, one per core).
+    """
+
+    def __init__(self, path, threads=0):
+        if ort is None:
+            raise RuntimeError("onnxruntime is not installed (pip install onnxruntime)")
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"{path} not found; run python export_onnx.py first")
+        self.path = path
+        self.reload(threads)
+
+    def reload(self, threads=None):
+        """New session, e.g. in a forked worker (ORT thread pools do not survive fork())"""
+        if threads is not None:
+            self.threads = threads
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        self.session = ort.InferenceSession(self.path, options, providers=["CPUExecutionProvider"])
+        self.input = self.session.get_inputs()[0].name
+
+    def __call__(self, x):
+        outputs = self.session.run(None, {self.input: np.ascontiguousarray(x, dtype=np.float32)})
+        return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+
+def load_embedder(directory, threads=0):
+    return OnnxSession(model_path(directory, EMBEDDER), threads)
+
+
+# --------------------------
+# MTCNN in numpy
+# --------------------------
+def _windows(start, end, out):
+    """Adaptive average pooling windows [lo, hi) of `out` cells over each [start, end)"""
+    start, end = np.atleast_1d(start)[:, None], np.atleast_1d(end)[:, None]
+    cells, size = np.arange(out), end - start
+    return start + cells * size // out, start - (-(cells + 1) * size // out)
+
+
+def _integral(imgs):
+    """(B, H+1, W+1, C) int64 summed-area tables of (B, H, W, C) uint8 images"""
+    tables = np.zeros((imgs.shape[0], imgs.shape[1] + 1, imgs.shape[2] + 1, imgs.shape[3]), dtype=np.int64)
+    np.cumsum(imgs, axis=1, dtype=np.int64, out=tables[:, 1:, 1:])
+    np.cumsum(tables[:, 1:, 1:], axis=2, out=tables[:, 1:, 1:])
+    return tables
+
+
+def _area_resize(tables, image_inds, y0, x0, y1, x1, height, width):
+    """
+    torch interpolate(mode="area") of the crops img[y0:y1, x0:x1] of the
+    given images to (N, 3, height, width) float32, from the integral
+    images: integer window sums, then sum / kh / kw in float32 as torch does
+    """
+    ys, ye = _windows(y0, y1, height)
+    xs, xe = _windows(x0, x1, width)
+    b = np.atleast_1d(image_inds)[:, None, None]
+    ys, ye, xs, xe = ys[:, :, None], ye[:, :, None], xs[:, None, :], xe[:, None, :]
+    sums = (tables[b, ye, xe] - tables[b, ys, xe] - tables[b, ye, xs] + tables[b, ys, xs]).astype(np.float32)
+    kh = (ye - ys).astype(np.float32)[..., None]
+    kw = (xe - xs).astype(np.float32)[..., None]
+    return (sums / kh / kw).transpose(0, 3, 1, 2)
+
+
+def _normalize(pixels):
+    return (pixels - np.float32(127.5)) * np.float32(0.0078125)
+
+
+def nms(boxes, scores, threshold):
+    """torchvision.ops.nms: kept indices, best score first (float32 IoU, no +1)"""
+    x1, y1, x2, y2 = boxes.T
+    areas = (x2 - x1) * (y2 - y1)
+    order = np.argsort(-scores, kind="stable")
+    keep = []
+    while len(order):
+        i, rest = order[0], order[1:]
+        keep.append(i)
+        w = np.maximum(np.float32(0), np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]))
+        h = np.maximum(np.float32(0), np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]))
+        inter = w * h
+        order = rest[inter / (areas[i] + areas[rest] - inter) <= threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, image_inds, threshold):
+    """NMS within each image; indices sorted by score, best first"""
+    keep = [np.flatnonzero(image_inds == i)[nms(boxes[image_inds == i], scores[image_inds == i], threshold)]
+            for i in np.unique(image_inds)]
+    keep = np.concatenate(keep) if keep else np.zeros(0, np.int64)
+    return keep[np.argsort(-scores[keep], kind="stable")]
+
+
+def nms_min(boxes, scores, image_inds, threshold):
+    """facenet_pytorch's batched_nms_numpy(..., 'Min') for the last stage"""
+    if not len(boxes):
+        return np.zeros(0, np.int64)
+    boxes = boxes + (image_inds.astype(np.float32) * (boxes.max() + 1))[:, None]
+    x1, y1, x2, y2 = (boxes[:, i].copy() for i in range(4))
+    area = (x2 - x1 + 1) * (y2 - y1 + 1)
+    order = np.argsort(scores)
+    pick = []
+    while order.size > 0:
+        i, rest = order[-1], order[:-1]
+        pick.append(i)
+        w = np.maximum(0.0, np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]) + 1)
+        h = np.maximum(0.0, np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]) + 1)
+        inter = w * h
+        order = order[np.where(inter / np.minimum(area[i], area[rest]) <= threshold)]
+    return np.array(pick, dtype=np.int64)
+
+
+def _rerec(boxes):
+    """Square boxes around the same centre"""
+    h = boxes[:, 3] - boxes[:, 1]
+    w = boxes[:, 2] - boxes[:, 0]
+    side = np.maximum(w, h)
+    boxes[:, 0] = boxes[:, 0] + w * np.float32(0.5) - side * np.float32(0.5)
+    boxes[:, 1] = boxes[:, 1] + h * np.float32(0.5) - side * np.float32(0.5)
+    boxes[:, 2:4] = boxes[:, :2] + side[:, None]
+    return boxes
+
+
+def _bbreg(boxes, offsets):
+    w = boxes[:, 2] - boxes[:, 0] + 1
+    h = boxes[:, 3] - boxes[:, 1] + 1
+    boxes[:, :4] = boxes[:, :4] + offsets * np.stack([w, h, w, h], axis=1)
+    return boxes
+
+
+def _pad(boxes, width, height):
+    """Integer 1-based crop bounds clipped to the image"""
+    boxes = np.trunc(boxes).astype(np.int32)
+    x, y = np.maximum(boxes[:, 0], 1), np.maximum(boxes[:, 1], 1)
+    ex, ey = np.minimum(boxes[:, 2], width), np.minimum(boxes[:, 3], height)
+    return y, ey, x, ex
+
+
+class OnnxDetector:
+    """
+    MTCNN.detect() on ONNX Runtime sessions, same arguments and results
+    as facenet_pytorch's MTCNN with select_largest=True (faces sorted by
+    area, largest first).
+    """
+
+    def __init__(self, directory, image_size=160, margin=0, min_face_size=20,
+                 thresholds=(0.6, 0.7, 0.7), factor=PYRAMID_FACTOR, threads=0):
+        self.image_size = image_size
+        self.margin = margin
+        self.min_face_size = min_face_size
+        self.thresholds = list(thresholds)
+        self.factor = factor
+        self.pnet, self.rnet, self.onet = (OnnxSession(model_path(directory, name), threads)
+                                           for name in DETECTOR_NETS)
+
+    @property
+    def sessions(self):
+        return [self.pnet, self.rnet, self.onet]
+
+    def detect(self, img, landmarks=False):
+        """
+        (boxes, probs[, points]) for one RGB image, or lists of them for a
+        list of same-size images; boxes is None when there is no face
+        """
+        single = not isinstance(img, (list, tuple))
+        imgs = np.stack([np.asarray(i, dtype=np.uint8) for i in ([img] if single else img)])
+        batch_boxes, batch_points = self._detect_face(imgs)
+
+        boxes, probs, points = [], [], []
+        for box, point in zip(batch_boxes, batch_points):
+            if not len(box):
+                boxes.append(None)
+                probs.append([None])
+                points.append(None)
+                continue
+            order = np.argsort((box[:, 2] - box[:, 0]) * (box[:, 3] - box[:, 1]))[::-1]
+            boxes.append(box[order, :4])
+            probs.append(box[order, 4])
+            points.append(point[order])
+        if single:
+            boxes, probs, points = boxes[0], probs[0], points[0]
+        return (boxes, probs, points) if landmarks else (boxes, probs)
+
+    def _stage(self, net, tables, boxes, image_inds, size, width, height):
+        """Crop every box, area-resize to size x size and run R/O-Net -> (kept rows, outputs)"""
+        y, ey, x, ex = _pad(boxes, width, height)
+        valid = np.flatnonzero((ey > y - 1) & (ex > x - 1))
+        outputs = []
+        for i in range(0, len(valid), STAGE_BATCH):
+            k = valid[i:i + STAGE_BATCH]
+            crops = _area_resize(tables, image_inds[k], y[k] - 1, x[k] - 1, ey[k], ex[k], size, size)
+            outputs.append(net(_normalize(crops)))
+        return valid, tuple(np.concatenate(parts) for parts in zip(*outputs))
+
+    def _detect_face(self, imgs):
+        """facenet_pytorch detect_face: per image (K, 5) boxes + scores and (K, 5, 2) points"""
+        batch, height, width = imgs.shape[:3]
+        tables = _integral(imgs)
+        scale = 12.0 / self.min_face_size
+        min_side = min(height, width) * scale
+        scales = []
+        while min_side >= 12:
+            scales.append(scale)
+            scale, min_side = scale * self.factor, min_side * self.factor
+
+        # First stage: P-Net over the pyramid, NMS per scale and image
+        boxes, image_inds = [], []
+        for scale in scales:
+            h, w = int(height * scale + 1), int(width * scale + 1)
+            pyramid = _area_resize(tables, np.arange(batch), 0, 0, height, width, h, w)
+            offsets, probs = self.pnet(_normalize(pyramid))
+            mask = probs[:, 1] >= self.thresholds[0]
+            inds, ys, xs = np.nonzero(mask)
+            cells = np.stack([xs, ys], axis=1).astype(np.float32)
+            scale_boxes = np.concatenate([
+                np.floor((2 * cells + 1) / np.float32(scale)),
+                np.floor((2 * cells + 12) / np.float32(scale)),
+                probs[:, 1][mask][:, None],
+                offsets.transpose(0, 2, 3, 1)[mask],
+            ], axis=1).astype(np.float32)
+            pick = batched_nms(scale_boxes[:, :4], scale_boxes[:, 4], inds, 0.5)
+            boxes.append(scale_boxes[pick])
+            image_inds.append(inds[pick])
+        boxes = np.concatenate(boxes) if boxes else np.zeros((0, 9), np.float32)
+        image_inds = np.concatenate(image_inds) if image_inds else np.zeros(0, np.int64)
+
+        pick = batched_nms(boxes[:, :4], boxes[:, 4], image_inds, 0.7)
+        boxes, image_inds = boxes[pick], image_inds[pick]
+        w, h = boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1]
+        boxes = np.stack([boxes[:, 0] + boxes[:, 5] * w, boxes[:, 1] + boxes[:, 6] * h,
+                          boxes[:, 2] + boxes[:, 7] * w, boxes[:, 3] + boxes[:, 8] * h, boxes[:, 4]], axis=1)
+        boxes = _rerec(boxes)
+
+        # Second stage: R-Net on 24x24 crops
+        if len(boxes):
+            valid, (offsets, probs) = self._stage(self.rnet, tables, boxes, image_inds, 24, width, height)
+            boxes, image_inds = boxes[valid], image_inds[valid]
+            passed = probs[:, 1] > self.thresholds[1]
+            boxes = np.concatenate([boxes[passed, :4], probs[passed, 1:2]], axis=1)
+            image_inds, offsets = image_inds[passed], offsets[passed]
+            pick = batched_nms(boxes[:, :4], boxes[:, 4], image_inds, 0.7)
+            boxes = _rerec(_bbreg(boxes[pick], offsets[pick]))
+            image_inds = image_inds[pick]
+
+        # Third stage: O-Net on 48x48 crops, landmarks
+        points = np.zeros((0, 5, 2), np.float32)
+        if len(boxes):
+            valid, (offsets, marks, probs) = self._stage(self.onet, tables, boxes, image_inds, 48, width, height)
+            boxes, image_inds = boxes[valid], image_inds[valid]
+            passed = probs[:, 1] > self.thresholds[2]
+            boxes = np.concatenate([boxes[passed, :4], probs[passed, 1:2]], axis=1)
+            image_inds, offsets, marks = image_inds[passed], offsets[passed], marks[passed]
+            w = boxes[:, 2] - boxes[:, 0] + 1
+            h = boxes[:, 3] - boxes[:, 1] + 1
+            points = np.stack([w[:, None] * marks[:, :5] + boxes[:, 0:1] - 1,
+                               h[:, None] * marks[:, 5:] + boxes[:, 1:2] - 1], axis=2)
+            boxes = _bbreg(boxes, offsets)
+            pick = nms_min(boxes[:, :4], boxes[:, 4], image_inds, 0.7)
+            boxes, image_inds, points = boxes[pick], image_inds[pick], points[pick]
+
+        return ([boxes[image_inds == b] for b in range(batch)],
+                [points[image_inds == b] for b in range(batch)])
@@ -5,38 +5,48 @@ Runs as a background service and provides API endpoint for frontend
 """
 import os
 import cv2
-import torch
 import numpy as np
-import requests
 import time
-import threading
+import re
+import json
 from flask import Flask, request, jsonify
 from flask_cors import CORS
-from facenet_pytorch import MTCNN, InceptionResnetV1
+from face_engine import FaceEngine, EngineConfig
+from frame_stream import FrameStream
 import base64
-from io import BytesIO
-from PIL import Image
+
+try:
+    # Optional: WebSocket streaming endpoint (pip install flask-sock)
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
 
 # Flask app setup
 app = Flask(__name__)
+# Raw and multipart uploads are read into memory; reject anything larger
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['SOCK_SERVER_OPTIONS'] = {'ping_interval': 25, 'max_message_size': 16 * 1024 * 1024}
 CORS(app)
+sock = Sock(app) if Sock is not None else None
 
 # --------------------------
-# Device & models
+# Face engine (models, gallery, matcher)
 # --------------------------
-device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-print(f"🚀 Face Recognition Service - Using device: {device}")
-
-mtcnn = MTCNN(
-    image_size=160,
-    margin=30,
-    min_face_size=40,
-    thresholds=[0.7, 0.8, 0.8],
-    keep_all=True,
-    device=device
-)
-
-resnet = InceptionResnetV1(pretrained='vggface2').eval().to(device)
+# FACE_INDEX_BACKEND=exact|ivf|quantized (FACE_IVF_NPROBE trades recall for
+# latency, FACE_INDEX_PRECISION=int8|float16 shrinks the scanned copy),
+# FACE_GALLERY_MODE=images|prototypes (FACE_PROTOTYPES_K centroids per person).
+# Requests are served concurrently, so face crops of simultaneous requests
+# are embedded together: FACE_EMBED_BATCH faces per pass (0 = off).
+# FACE_SHARED_GALLERY=<dir> publishes the gallery as a memory-mapped file
+# that pool workers and webcam loops on this host map instead of copying.
+# FACE_EMBEDDER_OPTIMIZE=int8,channels_last,script,compile runs live
+# recognition on an optimized CPU copy of the embedder (checked for drift).
+# FACE_RUNTIME=onnx runs the models exported by export_onnx.py in ONNX Runtime.
+engine = FaceEngine(EngineConfig.from_env(
+    embed_batch_size=int(os.environ.get("FACE_EMBED_BATCH", "32")),
+    embed_batch_wait_ms=float(os.environ.get("FACE_EMBED_BATCH_WAIT_MS", "3"))))
+print(f"🚀 Face Recognition Service - Using device: {engine.device}")
 
 # --------------------------
 # Dignitary Database
@@ -53,149 +63,138 @@ DIGNITARIES = {
 }
 
 # --------------------------
-# Global variables
+# Gallery loading
 # --------------------------
-known_face_encodings = []
-known_face_names = []
-model_loaded = False
-
+# Recognition reads engine gallery snapshots and never blocks; a reload
+# builds a new gallery and swaps the reference, enrollment appends in place.
 def load_embeddings():
     """Load face embeddings from dataset"""
-    global known_face_encodings, known_face_names, model_loaded
-    
-    known_face_encodings.clear()
-    known_face_names.clear()
-    
-    dataset_path = "dataset"
-    if not os.path.exists(dataset_path):
-        print(f"❌ Dataset path not found: {dataset_path}")
-        return False
-    
-    print("🔄 Loading face embeddings...")
-    
-    for person_name in os.listdir(dataset_path):
-        person_folder = os.path.join(dataset_path, person_name)
-        if not os.path.isdir(person_folder):
-            continue
+    loaded = engine.load_dataset()
+    print(f"\n🎯 Model loaded: {loaded}")
+    return loaded
 
-        print(f"📸 Processing {person_name}...")
-        count = 0
-        
-        for img_name in os.listdir(person_folder):
-            img_path = os.path.join(person_folder, img_name)
-            img = cv2.imread(img_path)
-            if img is None:
-                continue
-                
-            img = img[:,:,::-1]  # BGR -> RGB
-            boxes, _ = mtcnn.detect(img)
-            if boxes is None:
-                continue
-                
-            x1, y1, x2, y2 = map(int, boxes[0])
-            x1, y1 = max(0, x1), max(0, y1)
-            x2, y2 = min(img.shape[1], x2), min(img.shape[0], y2)
-            face = img[y1:y2, x1:x2]
-            if face.size == 0:
-                continue
-                
-            face = cv2.resize(face, (160,160))
-            face_tensor = torch.tensor(face).permute(2,0,1).unsqueeze(0).float()/255.0
-            face_tensor = face_tensor.to(device)
-            
-            with torch.no_grad():
-                embedding = resnet(face_tensor).detach().cpu().numpy()
-                embedding = embedding / np.linalg.norm(embedding)
-                
-            known_face_encodings.append(embedding)
-            known_face_names.append(person_name)
-            count += 1
-
-        print(f"  ✅ Loaded {count} images for {person_name}")
-
-    model_loaded = len(known_face_names) > 0
-    print(f"\n🎯 Model loaded: {model_loaded}")
-    print(f"📊 Total people: {len(set(known_face_names))}")
-    print(f"📊 Total embeddings: {len(known_face_names)}")
-    return model_loaded
-
-def recognize_face_from_image(image_data):
-    """Recognize face from base64 image data"""
-    if not model_loaded:
+def decode_image_bytes(buffer):
+    """Decode an encoded image (JPEG, PNG, ...) straight from a bytes-like buffer to RGB"""
+    data = np.frombuffer(memoryview(buffer), dtype=np.uint8)  # no copy
+    if not data.size:
+        return None
+    img = cv2.imdecode(data, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    return cv2.cvtColor(img, cv2.COLOR_BGR2RGB, dst=img)  # in place
+
+def decode_image(image_data):
+    """Decode base64 (optionally data-URL) image data to an RGB numpy array"""
+    if image_data.startswith('data:image'):
+        image_data = image_data.split(',', 1)[1]
+    try:
+        image_bytes = base64.b64decode(image_data)
+    except ValueError:
+        return None
+    return decode_image_bytes(image_bytes)
+
+def request_image():
+    """
+    RGB image of a recognition request, or None:
+      - raw body with Content-Type image/jpeg (or any image/*)
+      - multipart/form-data with an "image" file field
+      - JSON {"image": "<base64 or data URL>"} (original frontend format)
+    """
+    if request.mimetype.startswith('image/'):
+        return decode_image_bytes(request.get_data(cache=False))
+    if request.mimetype == 'multipart/form-data':
+        upload = request.files.get('image')
+        return decode_image_bytes(upload.read()) if upload else None
+    data = request.get_json(silent=True)
+    if not data or not isinstance(data.get('image'), str):
+        return None
+    return decode_image(data['image'])
+
+def decode_stream_frame(data):
+    """WebSocket frame: binary JPEG/PNG, or a text message with base64 / a data URL"""
+    if isinstance(data, str):
+        return decode_image(data)
+    return decode_image_bytes(data)
+
+def face_payload(face):
+    """JSON-friendly RecognizedFace; name stays None until the track's identity is confirmed"""
+    return {
+        "track_id": face.track_id,
+        "name": face.name,
+        "confidence": round(face.confidence, 1),
+        "is_dignitary": face.name in DIGNITARIES,
+        "box": list(face.box)
+    }
+
+def recognize_face(img):
+    """Recognize the first face in an RGB image"""
+    if not engine.loaded:
         return {"success": False, "error": "Model not loaded"}
     
     try:
-        # Decode base64 image
-        if image_data.startswith('data:image'):
-            image_data = image_data.split(',')[1]
-        
-        image_bytes = base64.b64decode(image_data)
-        image = Image.open(BytesIO(image_bytes))
-        img = np.array(image)
-        
-        if len(img.shape) == 3 and img.shape[2] == 4:  # RGBA
-            img = cv2.cvtColor(img, cv2.COLOR_RGBA2RGB)
-        elif len(img.shape) == 3 and img.shape[2] == 3:  # RGB
-            pass  # Already RGB
-        else:
-            return {"success": False, "error": "Invalid image format"}
-        
-        # Detect faces
-        boxes, _ = mtcnn.detect(img)
-        if boxes is None:
+        # Detect, embed and match the first detected face
+        faces = engine.recognize(img, max_faces=1)
+        if not faces:
             return {"success": False, "error": "No face detected"}
         
-        # Process first detected face
-        x1, y1, x2, y2 = map(int, boxes[0])
-        x1, y1 = max(0, x1), max(0, y1)
-        x2, y2 = min(img.shape[1], x2), min(img.shape[0], y2)
-        face = img[y1:y2, x1:x2]
-        
-        if face.size == 0:
-            return {"success": False, "error": "Invalid face region"}
-        
-        face = cv2.resize(face, (160,160))
-        face_tensor = torch.tensor(face).permute(2,0,1).unsqueeze(0).float()/255.0
-        face_tensor = face_tensor.to(device)
-        
-        with torch.no_grad():
-            embedding = resnet(face_tensor).detach().cpu().numpy()
-            embedding = embedding / np.linalg.norm(embedding)
-        
-        # Compare with known faces
-        if known_face_encodings:
-            distances = np.linalg.norm(np.array(known_face_encodings).squeeze() - embedding, axis=1)
-            best_idx = np.argmin(distances)
-            distance = distances[best_idx]
-            confidence = max(0, (1 - distance) * 100)
-            
-            # Recognition threshold
-            if distance < 0.8:  # Adjust as needed
-                name = known_face_names[best_idx]
-                return {
-                    "success": True,
-                    "name": name,
-                    "confidence": round(confidence, 1),
-                    "is_dignitary": name in DIGNITARIES
-                }
+        face = faces[0]
+        if face.name is not None:
+            return {
+                "success": True,
+                "name": face.name,
+                "confidence": round(face.confidence, 1),
+                "is_dignitary": face.name in DIGNITARIES
+            }
         
         return {"success": False, "error": "Face not recognized"}
         
     except Exception as e:
         return {"success": False, "error": str(e)}
 
+# --------------------------
+# Incremental enrollment
+# --------------------------
+PERSON_NAME_PATTERN = re.compile(r"^[A-Za-z0-9_\- ]{1,64}$")
+
+def save_enrollment_images(person_name, images):
+    """Decode uploaded images into dataset/<person_name>/ and return their paths"""
+    person_folder = os.path.join(engine.config.dataset_path, person_name)
+    os.makedirs(person_folder, exist_ok=True)
+
+    paths = []
+    for i, image_data in enumerate(images):
+        img = decode_image(image_data)
+        if img is None:
+            continue
+        img_path = os.path.join(person_folder, f"enroll_{int(time.time() * 1000)}_{i}.jpg")
+        cv2.imwrite(img_path, img[:,:,::-1])  # RGB -> BGR
+        paths.append(img_path)
+    return paths
+
+def enroll_images(person_name, images):
+    """Embed only the new images and add them to the live gallery"""
+    with engine.gallery_writes():
+        added, rejected = engine.enroll(person_name, save_enrollment_images(person_name, images))
+        for img_path in rejected:
+            os.remove(img_path)  # keep the dataset consistent with the gallery
+        # No usable photo of a new person: do not leave an empty folder behind
+        person_folder = os.path.join(engine.config.dataset_path, person_name)
+        if os.path.isdir(person_folder) and not os.listdir(person_folder):
+            os.rmdir(person_folder)
+    return added
+
 # --------------------------
 # API Endpoints
 # --------------------------
 @app.route('/api/recognize-dignitary', methods=['POST'])
 def recognize_dignitary():
-    """API endpoint for face recognition"""
+    """API endpoint for face recognition (raw image/jpeg, multipart or base64 JSON)"""
     try:
-        data = request.get_json()
-        if not data or 'image' not in data:
+        img = request_image()
+        if img is None:
             return jsonify({"success": False, "error": "Image data required"}), 400
         
-        result = recognize_face_from_image(data['image'])
+        result = recognize_face(img)
         
         if result["success"] and result.get("is_dignitary"):
             return jsonify({
@@ -209,15 +208,52 @@ def recognize_dignitary():
     except Exception as e:
         return jsonify({"success": False, "error": str(e)}), 500
 
+if sock is not None:
+    @sock.route('/api/recognize-stream')
+    def recognize_stream(ws):
+        """
+        WebSocket streaming recognition: the client sends frames (binary
+        JPEG, or base64 text), the server recognizes only the newest one
+        and replies with {"frame", "faces": [{"track_id", "name", ...}],
+        "dropped", "latency_ms", ...} after each processed frame, or
+        {"frame", "faces": [], "error"} when a frame is invalid or fails
+        """
+        if not engine.loaded:
+            ws.close(reason=1011, message="Model not loaded")
+            return
+
+        def send(frame_id, faces, stats):
+            ws.send(json.dumps({"frame": frame_id, "faces": [face_payload(f) for f in faces], **stats}))
+
+        stream = FrameStream(engine, decode_stream_frame, send)
+        try:
+            while not stream.closed:
+                data = ws.receive(timeout=1.0)
+                if data is not None:
+                    stream.push(data)
+        except ConnectionClosed:
+            pass
+        finally:
+            stream.close()
+            print(f"📡 Stream closed: {stream.summary()}")
+
 @app.route('/api/face-service/status', methods=['GET'])
 def service_status():
     """Check service status"""
     return jsonify({
         "status": "running",
-        "model_loaded": model_loaded,
-        "device": str(device),
+        "model_loaded": engine.loaded,
+        "device": str(engine.device),
+        "runtime": engine.config.runtime,
+        "streaming": sock is not None,
+        "pid": os.getpid(),
+        "shared_gallery": engine.config.shared_gallery,
+        "embedding_batches": engine.batcher.summary() if engine.batcher else "off",
+        "embedder": engine.embedder_summary(),
+        "index_backend": engine.config.index_backend,
+        "gallery_mode": engine.config.gallery_mode,
         "dignitaries_count": len(DIGNITARIES),
-        "embeddings_count": len(known_face_names)
+        "embeddings_count": len(engine.gallery)
     })
 
 @app.route('/api/face-service/reload', methods=['POST'])
@@ -226,8 +262,80 @@ def reload_model():
     success = load_embeddings()
     return jsonify({
         "success": success,
-        "model_loaded": model_loaded,
-        "embeddings_count": len(known_face_names)
+        "model_loaded": engine.loaded,
+        "embeddings_count": len(engine.gallery)
+    })
+
+@app.route('/api/face-service/persons', methods=['GET'])
+def list_persons():
+    """List enrolled people and their embedding counts"""
+    current = engine.gallery
+    counts = {}
+    for name in current.names:
+        counts[name] = counts.get(name, 0) + 1
+    return jsonify({
+        "success": True,
+        "gallery_mode": engine.config.gallery_mode,
+        "persons": counts,
+        "spreads": {name: round(spread, 4) for name, spread in current.spreads.items()}
+    })
+
+@app.route('/api/face-service/persons', methods=['POST'])
+def add_person():
+    """Enroll a new person from base64 images without re-scanning the dataset"""
+    data = request.get_json(silent=True) or {}
+    name = str(data.get('name', '')).strip()
+    images = data.get('images') or []
+    if not PERSON_NAME_PATTERN.match(name):
+        return jsonify({"success": False, "error": "Valid person name required"}), 400
+    if not images:
+        return jsonify({"success": False, "error": "At least one image required"}), 400
+
+    # Check and enroll under the write lock, so two requests for the same
+    # new name cannot both pass the check
+    with engine.gallery_writes():
+        if name in engine.gallery.names:
+            return jsonify({"success": False, "error": f"{name} is already enrolled"}), 409
+        added = enroll_images(name, images)
+    return jsonify({
+        "success": added > 0,
+        "name": name,
+        "added_embeddings": added,
+        "embeddings_count": len(engine.gallery)
+    }), (201 if added else 422)
+
+@app.route('/api/face-service/persons/<name>/images', methods=['POST'])
+def add_person_images(name):
+    """Add more images for an already enrolled person"""
+    data = request.get_json(silent=True) or {}
+    images = data.get('images') or []
+    if not PERSON_NAME_PATTERN.match(name) or name not in engine.gallery.names:
+        return jsonify({"success": False, "error": f"Unknown person: {name}"}), 404
+    if not images:
+        return jsonify({"success": False, "error": "At least one image required"}), 400
+
+    added = enroll_images(name, images)
+    return jsonify({
+        "success": added > 0,
+        "name": name,
+        "added_embeddings": added,
+        "embeddings_count": len(engine.gallery)
+    }), (200 if added else 422)
+
+@app.route('/api/face-service/persons/<name>', methods=['DELETE'])
+def delete_person(name):
+    """Remove a person from the gallery and the dataset"""
+    if not PERSON_NAME_PATTERN.match(name):
+        return jsonify({"success": False, "error": "Valid person name required"}), 400
+    if name not in engine.gallery.names and not os.path.isdir(os.path.join(engine.config.dataset_path, name)):
+        return jsonify({"success": False, "error": f"Unknown person: {name}"}), 404
+
+    removed = engine.remove_person(name)
+    return jsonify({
+        "success": True,
+        "name": name,
+        "removed_embeddings": removed,
+        "embeddings_count": len(engine.gallery)
     })
 
 if __name__ == '__main__':
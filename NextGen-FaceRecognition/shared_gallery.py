@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Gallery shared between processes through memory-mapped files
+Every published gallery version is one file in the shared directory:
+
+    header   magic, version, count, dim, metadata offset/length (64 bytes)
+    matrix   count x dim float32, row-major
+    metadata JSON: labels, per-person spreads, embedding variant
+
+An 8-byte pointer file holds the current version. Readers (pool workers,
+webcam loops, other services on the host) keep it mapped, so checking for
+a new version is a memory read, and match straight against the mapped
+rows of the current version without copying them. When the pointer
+changes they map the new file, so enrollment by any process is picked
+up on the next lookup without a restart. Published files are never
+modified, and a reader keeps its old mapping until it has switched.
+Writers serialize on a lock file, bring their private copy up to date
+with the latest version, apply the change and publish the result as a
+new version.
+"""
+import contextlib
+import json
+import mmap
+import os
+import struct
+import threading
+import numpy as np
+from gallery import EMBEDDING_DIM, FaceGallery, GallerySnapshot, _State, _versions
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+MAGIC = b"RIVAGAL1"
+# magic, version, count, dim, metadata offset, metadata length, padded to 64
+HEADER = struct.Struct("<8sQQQQQ")
+HEADER_SIZE = 64
+POINTER = struct.Struct("<Q")
+POINTER_FILE = "current"
+LOCK_FILE = "lock"
+# Older version files kept for readers that have not switched yet
+KEEP_VERSIONS = 2
+
+
+def version_path(directory, version):
+    return os.path.join(directory, f"gallery-{version:08d}.bin")
+
+
+def open_pointer(directory):
+    """Read-only mapping of the version pointer (created as 0 if missing)"""
+    path = os.path.join(directory, POINTER_FILE)
+    if not os.path.exists(path):
+        # Link a complete file into place so no reader maps a short one
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(POINTER.pack(0))
+        with contextlib.suppress(FileExistsError):
+            os.link(tmp, path)
+        os.remove(tmp)
+    with open(path, "rb") as f:
+        return mmap.mmap(f.fileno(), POINTER.size, access=mmap.ACCESS_READ)
+
+
+def write_version(directory, version, encodings, labels, spreads, variant):
+    """Write one immutable gallery file, then point readers at it (call under the write lock)"""
+    encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+    count, dim = encodings.shape
+    metadata = json.dumps({"labels": list(labels), "spreads": spreads, "variant": variant}).encode()
+    offset = HEADER_SIZE + encodings.nbytes
+
+    path = version_path(directory, version)
+    with open(path + ".tmp", "wb") as f:
+        f.write(HEADER.pack(MAGIC, version, count, dim, offset, len(metadata)).ljust(HEADER_SIZE, b"\0"))
+        f.write(encodings.tobytes())
+        f.write(metadata)
+    os.replace(path + ".tmp", path)
+
+    # Updated in place: readers have this file mapped
+    with open(os.path.join(directory, POINTER_FILE), "r+b") as f:
+        f.write(POINTER.pack(version))
+
+    for old in range(max(1, version - 50), version - KEEP_VERSIONS + 1):
+        with contextlib.suppress(OSError):  # Windows: still mapped by a reader
+            os.remove(version_path(directory, old))
+
+
+def map_version(directory, version):
+    """(encodings view, labels, spreads, variant) of a published version"""
+    with open(version_path(directory, version), "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    magic, stored, count, dim, offset, length = HEADER.unpack_from(mapped)
+    if magic != MAGIC or stored != version:
+        raise ValueError(f"not a gallery file for version {version}")
+    # Zero-copy: the array keeps the mapping alive as long as it is used
+    encodings = np.frombuffer(mapped, dtype=np.float32, count=count * dim,
+                              offset=HEADER_SIZE).reshape(count, dim)
+    metadata = json.loads(mapped[offset:offset + length])
+    labels = np.array(metadata["labels"], dtype=object).reshape(count)
+    return encodings, labels, metadata["spreads"], metadata["variant"]
+
+
+class SharedGallery:
+    """
+    Drop-in for FaceGallery backed by a shared directory of versioned
+    files. Reads (snapshot, match, names, ...) use the newest published
+    version. Writes (add, remove, replace, load) update a private
+    FaceGallery and publish it. Until anything is published the private
+    gallery is served.
+    `on_stale()` is called under the write lock when another process
+    published since our last write (e.g. to reload the embedding cache).
+    """
+
+    def __init__(self, directory, variant, dim=EMBEDDING_DIM, index=None, on_stale=None):
+        self.directory = directory
+        self.variant = variant
+        self.dim = dim
+        self.on_stale = on_stale
+        self._local = FaceGallery(dim, index=index)
+        self._index = self._local._index
+        self._local_version = 0        # published version the private gallery matches
+        self._mapped = None            # (published version, _State, spreads)
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+        os.makedirs(directory, exist_ok=True)
+        self._pointer = open_pointer(directory)
+
+    # --------------------------
+    # Reading
+    # --------------------------
+    def published_version(self):
+        return POINTER.unpack_from(self._pointer)[0]
+
+    def refresh(self):
+        """Map the newest published version; True if one is mapped"""
+        version = self.published_version()
+        if self._mapped is not None and self._mapped[0] == version:
+            return True
+        if not version:
+            return False
+        try:
+            encodings, labels, spreads, variant = map_version(self.directory, version)
+        except (OSError, ValueError) as e:
+            print(f"⚠️  Cannot map shared gallery version {version}: {e}")
+            return self._mapped is not None
+        if variant != self.variant:
+            print(f"⚠️  Shared gallery was built for {variant}, not {self.variant}; ignoring it")
+            return False
+        state = _State(encodings, labels, len(labels), self._index.build(encodings), next(_versions))
+        state.index.release(encodings)
+        self._mapped = (version, state, spreads)
+        return True
+
+    def attach(self):
+        """Use an already published gallery (no dataset scan); False if there is none"""
+        return self.refresh()
+
+    def snapshot(self):
+        mapped = self._mapped
+        if mapped is None or mapped[0] != self.published_version():
+            self.refresh()
+            mapped = self._mapped
+        return GallerySnapshot(mapped[1]) if mapped is not None else self._local.snapshot()
+
+    def __len__(self):
+        return len(self.snapshot())
+
+    @property
+    def names(self):
+        return self.snapshot().names
+
+    @property
+    def version(self):
+        return self.snapshot().version
+
+    @property
+    def spreads(self):
+        mapped = self._mapped
+        return mapped[2] if mapped is not None else self._local.spreads
+
+    def match(self, embedding):
+        return self.snapshot().match(embedding)
+
+    # --------------------------
+    # Writing
+    # --------------------------
+    @contextlib.contextmanager
+    def lock(self):
+        """
+        Cross-process write lock (reentrant within this process). On entry
+        the private gallery is brought up to date with the newest version.
+        """
+        with self._lock:
+            if not self._lock_depth:
+                self._lock_file = open(os.path.join(self.directory, LOCK_FILE), "a+b")
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+                else:
+                    msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_LOCK, 1)
+            self._lock_depth += 1
+            try:
+                if self._lock_depth == 1:
+                    self._sync()
+                yield
+            finally:
+                self._lock_depth -= 1
+                if not self._lock_depth:
+                    if fcntl is not None:
+                        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    else:
+                        self._lock_file.seek(0)
+                        msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+                    self._lock_file.close()
+                    self._lock_file = None
+
+    def _sync(self):
+        """Rebuild the private gallery from a version another process published"""
+        version = self.published_version()
+        if version == self._local_version or not self.refresh():
+            return
+        _, state, spreads = self._mapped
+        local = FaceGallery(self.dim, index=self._index)
+        if state.count:
+            local.add(state.matrix, list(state.labels))
+        local.spreads = dict(spreads)
+        self._local = local
+        self._local_version = version
+        if self.on_stale is not None:
+            self.on_stale()
+
+    def publish(self):
+        """Write the private gallery as the next version; returns it"""
+        with self.lock():
+            snapshot = self._local.snapshot()
+            version = self.published_version() + 1
+            write_version(self.directory, version, snapshot.encodings, snapshot.labels,
+                          self._local.spreads, self.variant)
+            snapshot.index.release(snapshot.encodings)
+            self._local_version = version
+            self.refresh()
+            return version
+
+    def load(self, gallery):
+        """Replace everything with a freshly built FaceGallery (dataset reload)"""
+        with self.lock():
+            self._local = gallery
+            self.publish()
+
+    def add(self, embeddings, names):
+        with self.lock():
+            self._local.add(embeddings, names)
+            self.publish()
+
+    def remove(self, name):
+        with self.lock():
+            removed = self._local.remove(name)
+            if removed:
+                self.publish()
+            return removed
+
+    def replace(self, name, embeddings, spread=None):
+        with self.lock():
+            self._local.replace(name, embeddings, spread)
+            self.publish()
+
+    def clear(self):
+        with self.lock():
+            self._local.clear()
+            self.publish()
@@ -1,23 +1,13 @@
 import os
 import cv2
 import numpy as np
-import requests
 import time
+from greeting_dispatcher import GreetingDispatcher, RIVA_GREET_URL
 
 # RIVA Integration
-RIVA_GREET_URL = "http://localhost:5000/api/greet"
-
-def send_greeting_to_riva(person_name):
-    try:
-        response = requests.post(RIVA_GREET_URL, json={"dignitary": person_name})
-        if response.status_code == 200:
-            data = response.json()
-            if data.get('success'):
-                print(f"✅ RIVA greeted: {person_name}")
-                return True
-    except Exception as e:
-        print(f"❌ Failed to send greeting: {e}")
-    return False
+# Greetings are posted by a background worker so recognition never waits
+# on the backend (see greeting_dispatcher.py)
+greeter = GreetingDispatcher(RIVA_GREET_URL)
 
 # Dignitary Database
 DIGNITARIES = {
@@ -103,9 +93,14 @@ while True:
                  current_time - last_greeting_time[name] > 300)):
                 
                 formal_name = DIGNITARIES[name]
-                if send_greeting_to_riva(formal_name):
+                def greeting_done(success, name=name):
+                    if not success:
+                        last_greeting_time.pop(name, None)  # retry on the next sighting
+
+                # Cooldown starts when the greeting is queued
+                if greeter.send_greeting(formal_name, greeting_done):
                     last_greeting_time[name] = current_time
-                    print(f"🎤 Greeted: {formal_name}")
+                    print(f"🎤 Greeting queued: {formal_name}")
             
             color = (0, 255, 0) if name in DIGNITARIES else (255, 255, 0)
             cv2.rectangle(frame, (x, y), (x+w, y+h), color, 2)
@@ -124,4 +119,5 @@ while True:
         break
 
 video_capture.release()
+greeter.close()
 cv2.destroyAllWindows()
\ No newline at end of file
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+Threaded webcam pipeline: capture -> detect/embed/match -> display
+Each stage runs on its own thread and the stages are connected by
+single-slot latest-frame queues: a slow stage never builds a backlog, it
+just skips to the freshest frame. Display stays at camera FPS and always
+draws the most recent recognition results.
+"""
+import threading
+import time
+from collections import deque
+import cv2
+from face_tracker import FaceTracker
+from frame_scheduler import AdaptiveScheduler
+from motion_gate import MotionGate
+
+
+class LatestQueue:
+    """
+    Bounded (single-slot) queue: put() replaces an item nobody has taken yet
+    (counted in `dropped`), get() waits for an item newer than the last one
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._pending = False
+        self._closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if self._pending:
+                self.dropped += 1
+            self._item = item
+            self._pending = True
+            self._cond.notify_all()
+
+    def get(self, timeout=None):
+        """Next item, or None on timeout / after close()"""
+        with self._cond:
+            self._cond.wait_for(lambda: self._pending or self._closed, timeout)
+            if not self._pending:
+                return None
+            item, self._item, self._pending = self._item, None, False
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class RateMeter:
+    """Events per second over a sliding window"""
+
+    def __init__(self, window=2.0):
+        self.window = window
+        self._times = deque()
+
+    def tick(self):
+        now = time.perf_counter()
+        self._times.append(now)
+        while now - self._times[0] > self.window:
+            self._times.popleft()
+
+    @property
+    def rate(self):
+        times = tuple(self._times)  # read from other threads
+        if len(times) < 2 or times[-1] == times[0]:
+            return 0.0
+        return (len(times) - 1) / (times[-1] - times[0])
+
+
+class VideoPipeline:
+    """
+    Runs a FaceEngine on a camera with separate capture, inference and
+    display threads. Callbacks:
+        on_faces(faces)         inference thread, after every processed frame
+        draw(frame, faces)      display thread, draw overlays in place
+        on_key(key)             display thread; return False to stop
+    Display runs on the calling thread (required by cv2.imshow on macOS).
+    Faces are tracked across frames (face_tracker.py) so a track is only
+    re-embedded periodically; pass your own FaceTracker to tune it.
+    How often recognition runs is decided by an AdaptiveScheduler
+    (frame_scheduler.py) from measured stage latency and scene activity.
+    A MotionGate (motion_gate.py) skips detection while nothing moves;
+    pass motion_gate=False to detect on every scheduled pass.
+    """
+
+    def __init__(self, engine, camera=0, window_name="Face Recognition", tracker=None,
+                 scheduler=None, motion_gate=None, refresh_interval=5.0):
+        self.engine = engine
+        self.camera = camera
+        self.window_name = window_name
+        self.tracker = tracker or FaceTracker()
+        self.scheduler = scheduler or AdaptiveScheduler()
+        self.motion_gate = MotionGate() if motion_gate is None else motion_gate
+        # Detect at least this often even without motion (seconds)
+        self.refresh_interval = refresh_interval
+        self.gated_passes = 0
+        self._motion_pending = True
+        self._last_detection = 0.0
+        self.capture = None
+        self.inference_queue = LatestQueue()
+        self.display_queue = LatestQueue()
+        # (frame id, [RecognizedFace]) of the most recently processed frame
+        self.results = (0, [])
+        self.capture_rate = RateMeter()
+        self.inference_rate = RateMeter()
+        self.display_rate = RateMeter()
+        self._frame = None
+        self._frame_id = 0
+        self._stop = threading.Event()
+        self._threads = []
+
+    # --------------------------
+    # Stages
+    # --------------------------
+    def _capture_loop(self):
+        while not self._stop.is_set():
+            ret, frame = self.capture.read()
+            if not ret:
+                print("❌ Camera not accessible!")
+                self._stop.set()
+                break
+            self._frame_id += 1
+            self._frame = frame
+            self.capture_rate.tick()
+            if self.motion_gate and self.motion_gate.update(frame):
+                self._motion_pending = True
+                self.scheduler.notify_motion()
+            item = (self._frame_id, frame)
+            self.inference_queue.put(item)
+            self.display_queue.put(item)
+        self.inference_queue.close()
+        self.display_queue.close()
+
+    def _inference_loop(self, on_faces):
+        while not self._stop.is_set():
+            # Wait out the scheduled pause (in short steps, so a motion
+            # notification can cut it short), then take the newest frame
+            delay = self.scheduler.delay()
+            while delay > 0 and not self._stop.wait(min(delay, 0.05)):
+                delay = self.scheduler.delay()
+            if self._stop.is_set():
+                break
+            if self._gated():
+                continue
+            item = self.inference_queue.get(timeout=0.5)
+            if item is None:
+                continue
+            frame_id, frame = item
+            self._last_detection = time.monotonic()
+            timings = {}
+            faces = self.engine.recognize(frame[:,:,::-1], tracker=self.tracker, timings=timings)
+            self.scheduler.update(timings, self.tracker, faces)
+            self.results = (frame_id, faces)
+            self.inference_rate.tick()
+            if on_faces is not None:
+                on_faces(faces)
+
+    def _gated(self):
+        """Skip this pass when nothing moved, no track is still voting and a refresh is not due"""
+        if not self.motion_gate or self._motion_pending or self.scheduler.state == "active":
+            self._motion_pending = False
+            return False
+        if time.monotonic() - self._last_detection >= self.refresh_interval:
+            return False
+        self.gated_passes += 1
+        self.scheduler.skip()
+        return True
+
+    def gate_summary(self):
+        """Motion gate hit rate and the detection time it saved"""
+        gate = self.motion_gate
+        if not gate:
+            return "disabled"
+        saved = self.gated_passes * self.scheduler.stage_seconds.get("detect", 0.0)
+        return (f"motion in {gate.hit_rate * 100:.0f}% of {gate.frames} frames, "
+                f"{self.gated_passes} detection passes skipped (~{saved:.1f}s of MTCNN saved "
+                f"for {gate.seconds:.2f}s of gate time, {gate.cost_ms:.2f}ms/frame)")
+
+    def latest_frame(self):
+        """Most recent camera frame (BGR), for callers that capture snapshots"""
+        return self._frame
+
+    def stats(self):
+        return {
+            "capture_fps": self.capture_rate.rate,
+            "inference_fps": self.inference_rate.rate,
+            "display_fps": self.display_rate.rate,
+            "frames_skipped": self.inference_queue.dropped,
+            "results_lag": self._frame_id - self.results[0],
+            "faces": self.tracker.stats["faces"],
+            "embedded": self.tracker.stats["embedded"],
+            "schedule": self.scheduler.state,
+            "interval_ms": self.scheduler.interval * 1000,
+            "motion_hit_rate": self.motion_gate.hit_rate if self.motion_gate else 1.0,
+            "gated_passes": self.gated_passes,
+        }
+
+    def draw_stats(self, frame, origin=(10, 120)):
+        stats = self.stats()
+        embedded = stats["embedded"] / stats["faces"] * 100 if stats["faces"] else 0.0
+        text = (f"Camera {stats['capture_fps']:.0f} fps | "
+                f"Recognition {stats['inference_fps']:.1f} fps | "
+                f"Embedded {embedded:.0f}% of faces | "
+                f"{stats['schedule']} {stats['interval_ms']:.0f}ms | "
+                f"Motion {stats['motion_hit_rate'] * 100:.0f}%")
+        cv2.putText(frame, text, origin, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (255, 255, 255), 1)
+
+    # --------------------------
+    # Lifecycle
+    # --------------------------
+    def start(self, on_faces=None):
+        self.capture = cv2.VideoCapture(self.camera)
+        self._stop.clear()
+        self._threads = [
+            threading.Thread(target=self._capture_loop, name="capture", daemon=True),
+            threading.Thread(target=self._inference_loop, args=(on_faces,), name="inference", daemon=True),
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.inference_queue.close()
+        self.display_queue.close()
+        for thread in self._threads:
+            thread.join(timeout=5)
+        if self.capture is not None:
+            self.capture.release()
+        cv2.destroyAllWindows()
+        print(f"👣 Tracking: {self.tracker.summary()}")
+        print(f"⏱️ Scheduler: {self.scheduler.summary()}")
+        print(f"🚶 Motion gate: {self.gate_summary()}")
+
+    def run(self, on_faces=None, draw=None, on_key=None):
+        """Start capture/inference and run the display loop until 'q' or camera failure"""
+        self.start(on_faces)
+        try:
+            while not self._stop.is_set():
+                item = self.display_queue.get(timeout=0.5)
+                if item is None:
+                    continue
+                # Inference may still be reading this frame, draw on a copy
+                frame = item[1].copy()
+                _, faces = self.results
+                if draw is not None:
+                    draw(frame, faces)
+                cv2.imshow(self.window_name, frame)
+                self.display_rate.tick()
+
+                key = cv2.waitKey(1) & 0xFF
+                if key == ord('q'):
+                    break
+                if on_key is not None and key != 0xFF and on_key(key) is False:
+                    break
+        finally:
+            self.stop()
@@ -12,6 +12,9 @@ const FaceRecognition = ({ onComplete }) => {
   const videoRef = useRef(null);
   const canvasRef = useRef(null);
   const intervalRef = useRef(null);
+  const socketRef = useRef(null);
+  const framesSent = useRef(0);
+  const framesAnswered = useRef(0);
   const timeoutRef = useRef(null);
   const greetedPeople = useRef(new Set());
 
@@ -57,7 +60,64 @@ const FaceRecognition = ({ onComplete }) => {
     }
   };
 
+  // Frames sent but not answered yet; the server drops older frames anyway
+  const MAX_FRAMES_IN_FLIGHT = 2;
+
   const startRecognitionLoop = () => {
+    // Stream frames over a WebSocket; fall back to HTTP polling when the
+    // face service has no streaming endpoint
+    const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+    let socket;
+    try {
+      socket = new WebSocket(`${protocol}//${window.location.host}/api/recognize-stream`);
+    } catch (error) {
+      startPolling();
+      return;
+    }
+    let opened = false;
+    framesSent.current = 0;
+    framesAnswered.current = 0;
+
+    socket.onopen = () => {
+      opened = true;
+      intervalRef.current = setInterval(streamFrame, 250);
+    };
+    socket.onmessage = (event) => {
+      const result = JSON.parse(event.data);
+      framesAnswered.current = result.frame;
+      if (result.error) {
+        console.warn(`Frame ${result.frame} not recognized:`, result.error);
+      }
+      result.faces.forEach(face => {
+        if (face.name && DIGNITARIES[face.name]) {
+          handleRecognition(face.name, face.confidence);
+        }
+      });
+    };
+    socket.onclose = () => {
+      if (socketRef.current !== socket) return;  // closed by cleanup()
+      socketRef.current = null;
+      if (intervalRef.current) clearInterval(intervalRef.current);
+      if (!opened) {
+        console.warn('Recognition stream unavailable, polling instead');
+      }
+      startPolling();
+    };
+    socketRef.current = socket;
+  };
+
+  const streamFrame = async () => {
+    const socket = socketRef.current;
+    if (!socket || socket.readyState !== WebSocket.OPEN) return;
+    // Backpressure: never run more than a couple of frames ahead of the server
+    if (framesSent.current - framesAnswered.current >= MAX_FRAMES_IN_FLIGHT) return;
+    const imageBlob = await captureFrame();
+    if (!imageBlob || socket.readyState !== WebSocket.OPEN) return;
+    framesSent.current += 1;
+    socket.send(imageBlob);
+  };
+
+  const startPolling = () => {
     intervalRef.current = setInterval(() => {
       if (!isProcessing) {
         captureAndRecognize();
@@ -80,10 +140,9 @@ const FaceRecognition = ({ onComplete }) => {
     timeoutRef.current = countdown;
   };
 
-  const captureAndRecognize = async () => {
-    if (!videoRef.current || !canvasRef.current || cameraError) return;
+  const captureFrame = () => {
+    if (!videoRef.current || !canvasRef.current || cameraError) return Promise.resolve(null);
 
-    setIsProcessing(true);
     const canvas = canvasRef.current;
     const video = videoRef.current;
     const ctx = canvas.getContext('2d');
@@ -92,13 +151,21 @@ const FaceRecognition = ({ onComplete }) => {
     canvas.height = video.videoHeight;
     ctx.drawImage(video, 0, 0);
 
-    const imageData = canvas.toDataURL('image/jpeg', 0.8);
+    // Raw JPEG: a third smaller than base64 JSON and decoded without copies
+    return new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', 0.8));
+  };
+
+  const captureAndRecognize = async () => {
+    if (!videoRef.current || !canvasRef.current || cameraError) return;
+
+    setIsProcessing(true);
+    const imageBlob = await captureFrame();
 
     try {
       const response = await fetch('/api/recognize-dignitary', {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
-        body: JSON.stringify({ image: imageData })
+        headers: { 'Content-Type': 'image/jpeg' },
+        body: imageBlob
       });
 
       if (response.ok) {
@@ -185,6 +252,11 @@ const FaceRecognition = ({ onComplete }) => {
 
   const cleanup = () => {
     if (intervalRef.current) clearInterval(intervalRef.current);
+    if (socketRef.current) {
+      const socket = socketRef.current;
+      socketRef.current = null;
+      socket.close();
+    }
     if (timeoutRef.current) clearInterval(timeoutRef.current);
     
     if (videoRef.current && videoRef.current.srcObject) {